@@ -73,6 +73,7 @@ def scraper_control_ui():
             st.text_input("URL", key="new_source_url", placeholder="https://www.example.com/news")
             st.number_input("Depth", key="new_source_depth", value=1, step=1)
             st.selectbox("Target Content", ["Both", "PDFs Only", "Websites Only"], key="new_source_target")
+            st.selectbox("Discovery", ["Crawl Links", "Sitemaps and Feeds"], key="new_source_discovery")
             st.checkbox("Is Active", key="new_source_active", value=True)
             
             submitted = st.form_submit_button("Add Source")
@@ -82,6 +83,10 @@ def scraper_control_ui():
                     "PDFs Only": "PDF",
                     "Websites Only": "WEBSITE"
                 }
+                discovery_map = {
+                    "Crawl Links": "CRAWL",
+                    "Sitemaps and Feeds": "FEED"
+                }
 
                 url_match = re.match(r'^https://[-a-zA-Z0-9.]+(/[a-zA-Z0-9\-=&?\./]*)?$', st.session_state.new_source_url.strip())
                 parsed_url = urlparse(st.session_state.new_source_url)
@@ -92,6 +97,7 @@ def scraper_control_ui():
                         "path": parsed_url.path,
                         "depth": st.session_state.new_source_depth,
                         "target": target_map[st.session_state.new_source_target],
+                        "discovery": discovery_map[st.session_state.new_source_discovery],
                         "is_active": st.session_state.new_source_active
                     }
                     response = api_request("post", "sources", data=new_source)
@@ -1,3 +1,62 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from shared.core_lib.url_utils import canonicalize_url, registrable_domain, same_site, unique_urls
+
+# canonical urls key the seen index and article lookups, so two spellings of a page have to
+# come out the same and two different pages must not
+class CanonicalizeUrlTests(SimpleTestCase):
+    def test_host_is_lowercased_without_www_or_default_port(self):
+        self.assertEqual(canonicalize_url("HTTPS://WWW.Example.com:443/News"), "https://example.com/News")
+        self.assertEqual(canonicalize_url("http://example.com:80/news"), "https://example.com/news")
+
+    def test_other_ports_are_kept(self):
+        self.assertEqual(canonicalize_url("https://example.com:8080/news"), "https://example.com:8080/news")
+
+    def test_trailing_slash_and_dot_segments_are_dropped(self):
+        self.assertEqual(canonicalize_url("https://example.com/news/"), "https://example.com/news")
+        self.assertEqual(canonicalize_url("https://example.com/a/./b/../c"), "https://example.com/a/c")
+        self.assertEqual(canonicalize_url("https://example.com"), "https://example.com/")
+
+    def test_fragment_is_dropped(self):
+        self.assertEqual(canonicalize_url("https://example.com/news#top"), "https://example.com/news")
+
+    def test_encoded_slash_stays_encoded(self):
+        self.assertEqual(canonicalize_url("https://site.edu/a%2Fb/c"), "https://site.edu/a%2Fb/c")
+        self.assertEqual(canonicalize_url("https://site.edu/a%2fb/c"), "https://site.edu/a%2Fb/c")
+        self.assertNotEqual(canonicalize_url("https://site.edu/a%2Fb"), canonicalize_url("https://site.edu/a/b"))
+
+    def test_unreserved_characters_are_decoded(self):
+        self.assertEqual(canonicalize_url("https://site.edu/%7Euser"), canonicalize_url("https://site.edu/~user"))
+
+    def test_query_keeps_only_allowed_params_sorted(self):
+        url = "https://site.edu/news?utm_source=mail&page=2&id=42"
+
+        self.assertEqual(canonicalize_url(url, set()), "https://site.edu/news")
+        self.assertEqual(canonicalize_url(url, {"id", "page"}), "https://site.edu/news?id=42&page=2")
+
+    def test_different_allowed_params_stay_apart(self):
+        self.assertNotEqual(
+            canonicalize_url("https://site.edu/news?id=42", {"id"}),
+            canonicalize_url("https://site.edu/news?id=43", {"id"})
+        )
+
+    def test_unique_urls_keeps_the_first_spelling(self):
+        urls = ["https://www.site.edu/news/", "https://site.edu/news", "https://site.edu/events"]
+
+        self.assertEqual(unique_urls(urls), ["https://www.site.edu/news/", "https://site.edu/events"])
+
+class RegistrableDomainTests(SimpleTestCase):
+    def test_single_label_suffix(self):
+        self.assertEqual(registrable_domain("www.umich.edu"), "umich.edu")
+        self.assertEqual(registrable_domain("news.example.com:8080"), "example.com")
+
+    def test_multi_label_suffixes(self):
+        self.assertEqual(registrable_domain("news.bbc.co.uk"), "bbc.co.uk")
+        self.assertEqual(registrable_domain("www.unimelb.edu.au"), "unimelb.edu.au")
+
+    def test_ip_addresses_are_unchanged(self):
+        self.assertEqual(registrable_domain("192.168.0.1"), "192.168.0.1")
+
+    def test_same_site(self):
+        self.assertTrue(same_site("news.bbc.co.uk", "www.bbc.co.uk"))
+        self.assertFalse(same_site("bbc.co.uk", "itv.co.uk"))
@@ -1,16 +1,30 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from django.db.models import Q
+from django_filters import rest_framework as filters
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Article
 from .serializers import ArticleSerializer
+from shared.core_lib.url_utils import canonicalize_url
 from web_scraper.gdrive.api import GoogleDriveService
 from googleapiclient.errors import HttpError
 
+class ArticleFilter(filters.FilterSet):
+    # urls are stored as discovered, but some rows were written canonicalized, so both spellings match
+    url = filters.CharFilter(method='filter_url')
+
+    class Meta:
+        model = Article
+        fields = ['url']
+
+    def filter_url(self, queryset, name, value):
+        return queryset.filter(Q(url=value) | Q(url=canonicalize_url(value)))
+
 class ArticleViewSet(viewsets.ModelViewSet):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['url']
+    filterset_class = ArticleFilter
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -9,6 +9,7 @@ import os
 
 def insert_articles(conn, cursor, article_id, drive_id, url):
     query = "INSERT INTO articles (id, drive_id, url, creation_date, approved) VALUES (%s, %s, %s, %s, %s)"
+    # the url is stored as discovered so it still opens, lookups canonicalize it themselves
     values = (str(article_id), drive_id, url, datetime.now(), True)
 
     cursor.execute(query, values)
@@ -0,0 +1,18 @@
+import os
+
+import redis
+
+_redis_client = None
+
+def establish_redis_connection():
+    """
+    Returns a process wide redis client. The connection pool is created lazily
+    and reused by every caller in the same worker process.
+    """
+    global _redis_client
+
+    if _redis_client is None:
+        REDIS_URL = os.environ.get("REDIS_URL", os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0"))
+        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+    return _redis_client
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('source', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='discovery',
+            field=models.CharField(choices=[('CRAWL', 'Crawl Links'), ('FEED', 'Sitemaps and Feeds')], default='CRAWL', help_text="Crawl the source's links, or read article urls from its sitemaps and RSS/Atom feeds.", max_length=10),
+        ),
+    ]
@@ -7,6 +7,10 @@ class Source(models.Model):
         PDF = "PDF", "PDFs Only"
         WEBSITE = "WEBSITE", "Websites Only"
 
+    class DiscoveryType(models.TextChoices):
+        CRAWL = "CRAWL", "Crawl Links"
+        FEED = "FEED", "Sitemaps and Feeds"
+
     netloc = models.CharField(max_length=255)
     #category = models.ForeignKey(Category, on_delete=models.CASCADE, db_column='category_name')
     path = models.CharField(max_length=255)
@@ -17,6 +21,12 @@ class Source(models.Model):
         default=TargetType.BOTH,
         help_text="Specify what type of content to scrape from this source."
     )
+    discovery = models.CharField(
+        max_length=10,
+        choices=DiscoveryType.choices,
+        default=DiscoveryType.CRAWL,
+        help_text="Crawl the source's links, or read article urls from its sitemaps and RSS/Atom feeds."
+    )
     is_active = models.BooleanField(
         default=True,
         help_text="Only active sources will be used when the scraper is run."
@@ -0,0 +1,139 @@
+import os
+import re
+import posixpath
+from functools import lru_cache
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, quote, unquote
+
+# public suffixes made of more than one label, the registrable domain sits one label left of them
+MULTI_LABEL_SUFFIXES = {
+    "co.uk", "ac.uk", "gov.uk", "org.uk", "me.uk", "ltd.uk", "plc.uk", "net.uk", "sch.uk", "nhs.uk", "police.uk",
+    "com.au", "net.au", "org.au", "edu.au", "gov.au", "asn.au", "id.au",
+    "co.nz", "org.nz", "net.nz", "ac.nz", "govt.nz", "school.nz",
+    "co.jp", "ne.jp", "or.jp", "ac.jp", "go.jp",
+    "co.kr", "or.kr", "ac.kr", "go.kr",
+    "com.cn", "net.cn", "org.cn", "edu.cn", "gov.cn",
+    "com.hk", "org.hk", "edu.hk", "gov.hk",
+    "com.tw", "org.tw", "edu.tw", "gov.tw",
+    "com.sg", "org.sg", "edu.sg", "gov.sg",
+    "co.in", "net.in", "org.in", "ac.in", "gov.in", "edu.in",
+    "co.za", "org.za", "ac.za", "gov.za",
+    "com.br", "org.br", "gov.br", "edu.br",
+    "com.mx", "org.mx", "gob.mx", "edu.mx",
+    "com.ar", "org.ar", "gob.ar",
+    "com.tr", "org.tr", "edu.tr", "gov.tr",
+    "co.il", "org.il", "ac.il", "gov.il",
+    "com.my", "org.my", "edu.my", "gov.my",
+    "com.ph", "org.ph", "edu.ph", "gov.ph",
+    "com.pk", "org.pk", "edu.pk", "gov.pk",
+    "com.ng", "org.ng", "edu.ng", "gov.ng",
+    "co.ke", "or.ke", "ac.ke", "go.ke",
+    "com.eg", "edu.eg", "gov.eg",
+    "com.sa", "edu.sa", "gov.sa",
+    "co.id", "or.id", "ac.id", "go.id",
+    "co.th", "or.th", "ac.th", "go.th",
+    "com.vn", "edu.vn", "gov.vn",
+    "com.ua", "org.ua", "edu.ua", "gov.ua",
+    "com.pl", "org.pl", "edu.pl", "gov.pl",
+    "co.at", "or.at", "ac.at", "gv.at",
+    "k12.mi.us", "k12.ca.us", "k12.ny.us",
+}
+
+# query parameters that identify the content of a page and must survive canonicalization,
+# everything else (utm_*, fbclid, session ids, ...) is dropped
+CANONICAL_QUERY_PARAMS = set(filter(None, os.environ.get("CANONICAL_QUERY_PARAMS", "").split(",")))
+CANONICAL_STRIP_WWW = os.environ.get("CANONICAL_STRIP_WWW", "True") == "True"
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# characters that never need percent encoding in a path
+SAFE_PATH_CHARACTERS = "/:@!$&'()*+,;=-._~"
+
+IPV4_PATTERN = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
+ENCODED_SLASH = re.compile(r"%2f", re.IGNORECASE)
+
+@lru_cache(maxsize=65536)
+def normalize_host(netloc):
+    """Lowercases a host and drops its default port, the leading www. and any trailing dot."""
+    host = netloc.lower().rsplit("@", 1)[-1].rstrip(".")
+
+    host_name, _, port = host.partition(":")
+    if port in DEFAULT_PORTS.values():
+        host = host_name
+
+    if CANONICAL_STRIP_WWW and host.startswith("www."):
+        host = host[len("www."):]
+
+    return host
+
+@lru_cache(maxsize=65536)
+def registrable_domain(netloc):
+    """
+    Returns the domain a host was registered under, e.g. news.bbc.co.uk -> bbc.co.uk
+    and www.umich.edu -> umich.edu. IP addresses are returned unchanged.
+    """
+    host = normalize_host(netloc).partition(":")[0]
+    if host == "" or IPV4_PATTERN.match(host) or host.startswith("["):
+        return host
+
+    labels = host.split(".")
+    for suffix_length in (3, 2):
+        if len(labels) > suffix_length and ".".join(labels[-suffix_length:]) in MULTI_LABEL_SUFFIXES:
+            return ".".join(labels[-suffix_length - 1:])
+
+    return ".".join(labels[-2:])
+
+def same_site(netloc1, netloc2):
+    return registrable_domain(netloc1) == registrable_domain(netloc2)
+
+def normalize_path(path):
+    if path == "":
+        return "/"
+
+    # decode then re-encode so %7E and ~ (or a%20b and a b) become the same path. an encoded
+    # slash is not a path separator, so it stays encoded
+    path = "%2F".join(
+        quote(unquote(part), safe=SAFE_PATH_CHARACTERS + "%") for part in ENCODED_SLASH.split(path)
+    )
+
+    normalized = posixpath.normpath(path)
+    if normalized.startswith("//"):
+        normalized = "/" + normalized.lstrip("/")
+    if normalized == ".":
+        normalized = "/"
+
+    return normalized
+
+def normalize_query(query, allowed_params=None):
+    if allowed_params is None:
+        allowed_params = CANONICAL_QUERY_PARAMS
+
+    if query == "" or len(allowed_params) == 0:
+        return ""
+
+    params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key in allowed_params]
+    return urlencode(sorted(params))
+
+def canonicalize_url(url, allowed_params=None):
+    """
+    Returns the canonical form of a url: https, normalized host, normalized path without a
+    trailing slash, only allow-listed query parameters (sorted) and no fragment. Two urls that
+    point at the same page should come out identical.
+    """
+    parsed = urlparse(url.strip())
+
+    return urlunparse((
+        "https",
+        normalize_host(parsed.netloc),
+        normalize_path(parsed.path),
+        "",
+        normalize_query(parsed.query, allowed_params),
+        ""
+    ))
+
+def unique_urls(urls):
+    """Drops urls whose canonical form came up before, keeping the first spelling of each page."""
+    unique = {}
+    for url in urls:
+        unique.setdefault(canonicalize_url(url), url)
+
+    return list(unique.values())
@@ -1,28 +1,158 @@
 import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-import json
+from requests.adapters import HTTPAdapter
+
+from shared.core_lib.redis_utils import establish_redis_connection
 
 # lingering questions:
 #   can we make multiple calls per conversation pk?
 #   if so, what is the limit? is there a time limit? an call limit?
 #   if no limit, do we need to close the conversation?
 
+MAIZEY_CONNECT_TIMEOUT = float(os.environ.get("MAIZEY_CONNECT_TIMEOUT", 5))
+MAIZEY_READ_TIMEOUT = float(os.environ.get("MAIZEY_READ_TIMEOUT", 120))
+MAIZEY_MAX_CONCURRENCY = int(os.environ.get("MAIZEY_MAX_CONCURRENCY", 4))
+MAIZEY_MAX_RETRIES = int(os.environ.get("MAIZEY_MAX_RETRIES", 3))
+MAIZEY_BACKOFF_BASE = float(os.environ.get("MAIZEY_BACKOFF_BASE", 1))
+MAIZEY_BACKOFF_MAX = float(os.environ.get("MAIZEY_BACKOFF_MAX", 30))
+
+# the breaker opens for every worker after this many failed calls within the window
+MAIZEY_BREAKER_THRESHOLD = int(os.environ.get("MAIZEY_BREAKER_THRESHOLD", 5))
+MAIZEY_BREAKER_WINDOW = int(os.environ.get("MAIZEY_BREAKER_WINDOW", 60))
+MAIZEY_BREAKER_COOLDOWN = int(os.environ.get("MAIZEY_BREAKER_COOLDOWN", 120))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+BREAKER_FAILURES_KEY = "maizey:breaker:failures"
+BREAKER_OPEN_KEY = "maizey:breaker:open"
+
 class MaizeyCallError(Exception):
     pass
 
 class MaizeyImproperJson(Exception):
     pass
 
-def create_conversation(project_pk, api_key):
-    base_url = os.environ.get("MAIZEY_API_BASE_URL")
-    create_conversation_url = f"{base_url}{project_pk}/conversation/"
+class MaizeyUnavailable(MaizeyCallError):
+    """Raised without calling maizey while the circuit breaker is open."""
+
+    def __init__(self, message, retry_in):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+_session = None
+_session_lock = threading.Lock()
+# bounds the calls in flight from this process, however many threads make them
+_in_flight = threading.BoundedSemaphore(MAIZEY_MAX_CONCURRENCY)
+
+def get_session():
+    """One pooled session per process, so calls reuse their TCP/TLS connections."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAIZEY_MAX_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+    return _session
+
+def breaker_open_for():
+    """Returns how many seconds the breaker stays open, 0 if calls may go through."""
+    try:
+        remaining = establish_redis_connection().pttl(BREAKER_OPEN_KEY)
+    except Exception as e:
+        print(f"Could not read maizey circuit breaker: {e}")
+        return 0
+
+    return max(0, remaining) / 1000
+
+def record_failure():
+    try:
+        redis_conn = establish_redis_connection()
+        pipe = redis_conn.pipeline()
+        pipe.incr(BREAKER_FAILURES_KEY)
+        pipe.expire(BREAKER_FAILURES_KEY, MAIZEY_BREAKER_WINDOW)
+        failures = pipe.execute()[0]
+
+        if failures >= MAIZEY_BREAKER_THRESHOLD:
+            print(f"Maizey failed {failures} times in {MAIZEY_BREAKER_WINDOW}s, pausing calls for {MAIZEY_BREAKER_COOLDOWN}s")
+            redis_conn.set(BREAKER_OPEN_KEY, 1, ex=MAIZEY_BREAKER_COOLDOWN)
+            redis_conn.delete(BREAKER_FAILURES_KEY)
+    except Exception as e:
+        print(f"Could not update maizey circuit breaker: {e}")
+
+def record_success():
+    try:
+        establish_redis_connection().delete(BREAKER_FAILURES_KEY)
+    except Exception as e:
+        print(f"Could not update maizey circuit breaker: {e}")
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after is not None and retry_after.strip().isdigit():
+        return min(MAIZEY_BACKOFF_MAX, float(retry_after))
+
+    # full jitter, so workers that failed together do not retry together
+    return random.uniform(0, min(MAIZEY_BACKOFF_MAX, MAIZEY_BACKOFF_BASE * 2 ** attempt))
+
+def post(url, api_key, data=None):
+    """
+    Posts to maizey with timeouts, retrying 429/5xx answers and connection errors with
+    exponential backoff. Raises MaizeyUnavailable while the circuit breaker is open and
+    MaizeyCallError once the retries are used up.
+    """
+    retry_in = breaker_open_for()
+    if retry_in > 0:
+        raise MaizeyUnavailable(f"Maizey is paused for another {retry_in:.0f}s", retry_in)
+
     headers = {
         'accept': 'application/json',
         'Authorization': f"Bearer {api_key}",
         'Content-Type': 'application/json',
     }
 
-    response = requests.post(create_conversation_url, headers=headers)
+    error = None
+    for attempt in range(MAIZEY_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            with _in_flight:
+                response = get_session().post(url, headers=headers, json=data, timeout=(MAIZEY_CONNECT_TIMEOUT, MAIZEY_READ_TIMEOUT))
+
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code == 201:
+                    record_success()
+                return response
+
+            error = MaizeyCallError(f"Error {response.status_code}: {response.text}")
+            retry_after = response.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = MaizeyCallError(f"Error: {e}")
+
+        if attempt < MAIZEY_MAX_RETRIES:
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    record_failure()
+    raise error
+
+def run_concurrently(function, items):
+    """Maps function over items on MAIZEY_MAX_CONCURRENCY threads, keeping the order of items."""
+    if len(items) <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(MAIZEY_MAX_CONCURRENCY, len(items))) as executor:
+        return list(executor.map(function, items))
+
+def create_conversation(project_pk, api_key):
+    base_url = os.environ.get("MAIZEY_API_BASE_URL")
+    create_conversation_url = f"{base_url}{project_pk}/conversation/"
+
+    response = post(create_conversation_url, api_key)
     if response.status_code != 201:
         raise MaizeyCallError(f"Error {response.status_code}: {response.text}")
 
@@ -32,17 +162,11 @@ def call_api(project_pk, conversation_pk, api_key, prompt):
     base_url = os.environ.get("MAIZEY_API_BASE_URL")
     prompt_url = f"{base_url}{project_pk}/conversation/{conversation_pk}/messages/"
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f"Bearer {api_key}",
-        'Content-Type': 'application/json',
-    }
-
     data = {
         "query": prompt,
     }
 
-    response = requests.post(prompt_url, headers=headers, json=data)
+    response = post(prompt_url, api_key, data)
     if response.status_code != 201:
         raise MaizeyCallError(f"Error {response.status_code}: {response.text}")
 
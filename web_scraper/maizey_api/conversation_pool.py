@@ -0,0 +1,122 @@
+import os
+import time
+from contextlib import contextmanager
+
+from maizey_api.api_call import create_conversation, MaizeyCallError, MaizeyUnavailable
+
+from shared.core_lib.redis_utils import establish_redis_connection
+
+# nobody knows the per conversation limits (see api_call.py), so conversations are
+# retired well before they could plausibly run into one
+MAIZEY_CONVERSATION_MAX_MESSAGES = int(os.environ.get("MAIZEY_CONVERSATION_MAX_MESSAGES", 50))
+MAIZEY_CONVERSATION_MAX_AGE = int(os.environ.get("MAIZEY_CONVERSATION_MAX_AGE", 60 * 60))
+CONVERSATION_STATS_TTL = int(os.environ.get("CONVERSATION_STATS_TTL", 60 * 60 * 24 * 7))
+
+def idle_key(project_pk):
+    return f"maizey:conversations:{project_pk}:idle"
+
+def conversation_key(project_pk, conversation_pk):
+    return f"maizey:conversation:{project_pk}:{conversation_pk}"
+
+def created_key(run_id):
+    return f"maizey:conversations:created:{run_id}"
+
+def is_usable(state):
+    if not state:
+        return False
+
+    if int(state.get("messages", 0)) >= MAIZEY_CONVERSATION_MAX_MESSAGES:
+        return False
+
+    return time.time() - float(state.get("created", 0)) < MAIZEY_CONVERSATION_MAX_AGE
+
+def new_conversation(project_pk, api_key, run_id=None):
+    conversation_pk = create_conversation(project_pk, api_key)
+
+    try:
+        redis_conn = establish_redis_connection()
+        pipe = redis_conn.pipeline()
+        # the state expires with the conversation's age limit, a pk without state is never handed out again
+        pipe.hset(conversation_key(project_pk, conversation_pk), mapping={"created": time.time(), "messages": 0})
+        pipe.expire(conversation_key(project_pk, conversation_pk), MAIZEY_CONVERSATION_MAX_AGE)
+        if run_id is not None:
+            pipe.incr(created_key(run_id))
+            pipe.expire(created_key(run_id), CONVERSATION_STATS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not register maizey conversation {conversation_pk}: {e}")
+
+    return conversation_pk
+
+def acquire_conversation(project_pk, api_key, run_id=None):
+    """
+    Hands out an idle conversation pk, creating a conversation only when none is left. Popping
+    from the idle list is atomic, so a conversation is never used by two callers at once.
+    """
+    try:
+        redis_conn = establish_redis_connection()
+        while True:
+            conversation_pk = redis_conn.lpop(idle_key(project_pk))
+            if conversation_pk is None:
+                break
+
+            if is_usable(redis_conn.hgetall(conversation_key(project_pk, conversation_pk))):
+                return conversation_pk
+
+            redis_conn.delete(conversation_key(project_pk, conversation_pk))
+    except Exception as e:
+        print(f"Could not read maizey conversation pool: {e}")
+
+    return new_conversation(project_pk, api_key, run_id)
+
+def release_conversation(project_pk, conversation_pk, messages, healthy=True):
+    """Returns a conversation to the pool, or retires it once it is too old, too long or broken."""
+    key = conversation_key(project_pk, conversation_pk)
+
+    try:
+        redis_conn = establish_redis_connection()
+        if not healthy:
+            redis_conn.delete(key)
+            return
+
+        pipe = redis_conn.pipeline()
+        pipe.hincrby(key, "messages", messages)
+        pipe.hgetall(key)
+        state = pipe.execute()[-1]
+
+        if is_usable(state):
+            redis_conn.rpush(idle_key(project_pk), conversation_pk)
+        else:
+            redis_conn.delete(key)
+    except Exception as e:
+        print(f"Could not return maizey conversation {conversation_pk} to the pool: {e}")
+
+@contextmanager
+def pooled_conversation(project_pk, api_key, run_id=None):
+    """
+    Lends a conversation pk for one message. A conversation that failed is retired instead
+    of going back, it may be what is broken.
+    """
+    conversation_pk = acquire_conversation(project_pk, api_key, run_id)
+
+    try:
+        yield conversation_pk
+    except MaizeyUnavailable:
+        # nothing was sent, the conversation is as good as before
+        release_conversation(project_pk, conversation_pk, 0)
+        raise
+    except MaizeyCallError:
+        release_conversation(project_pk, conversation_pk, 1, healthy=False)
+        raise
+    except Exception:
+        release_conversation(project_pk, conversation_pk, 1)
+        raise
+    else:
+        release_conversation(project_pk, conversation_pk, 1)
+
+def conversations_created(run_id):
+    try:
+        return int(establish_redis_connection().get(created_key(run_id)) or 0)
+    except Exception as e:
+        print(f"Could not read maizey conversation stats: {e}")
+        return 0
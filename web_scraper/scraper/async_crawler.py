@@ -0,0 +1,284 @@
+import os
+import asyncio
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import shared_task
+
+from playwright.async_api import async_playwright
+
+from scraper.crawler import analyze_urls, hub_priority
+from scraper.frontier import Frontier
+from scraper.robots import is_allowed
+from scraper.browser_pool import async_connect_browser
+from scraper.interception import async_block_resources
+from scraper.wait_strategy import async_navigate
+from scraper.static_fetch import try_static_fetch, record_browser_fallback
+from scraper.hub_cache import load_hub, validator_headers, store_hub, refresh_hub, should_expand, mark_expanded
+from scraper.feeds import collect_feed_sources
+from scraper.crawl_state import LocalCrawlState, RedisCrawlState
+
+CRAWLER_CONTEXT_COUNT = int(os.environ.get("CRAWLER_CONTEXT_COUNT", 2))
+CRAWLER_PAGE_POOL_SIZE = int(os.environ.get("CRAWLER_PAGE_POOL_SIZE", 8))
+CRAWLER_MAX_IN_FLIGHT = int(os.environ.get("CRAWLER_MAX_IN_FLIGHT", 8))
+CRAWLER_MAX_PER_HOST = int(os.environ.get("CRAWLER_MAX_PER_HOST", 2))
+
+class PagePool:
+    """A fixed pool of pages spread across a few browser contexts on the CDP browser."""
+
+    def __init__(self, browser, page_count, context_count):
+        self.browser = browser
+        self.page_count = max(1, page_count)
+        self.context_count = max(1, min(context_count, self.page_count))
+        self.contexts = []
+        self.pages = asyncio.Queue()
+
+    async def open(self):
+        for _ in range(self.context_count):
+            self.contexts.append(await self.browser.new_context())
+
+        for i in range(self.page_count):
+            context = self.contexts[i % self.context_count]
+            page = await context.new_page()
+            await async_block_resources(page)
+            await self.pages.put(page)
+
+    async def acquire(self):
+        return await self.pages.get()
+
+    def release(self, page):
+        self.pages.put_nowait(page)
+
+    async def close(self):
+        for context in self.contexts:
+            try:
+                await context.close()
+            except Exception as e:
+                print(e)
+
+class HostLimiter:
+    """Hands out one semaphore per host so a single site never gets more than max_per_host navigations."""
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max(1, max_per_host)
+        self.semaphores = {}
+
+    def for_host(self, netloc):
+        if netloc not in self.semaphores:
+            self.semaphores[netloc] = asyncio.Semaphore(self.max_per_host)
+
+        return self.semaphores[netloc]
+
+async def async_retrieve_urls(page, url, timeout_time, max_retry):
+    # max_retry attempts plus the old "load" fallback attempt
+    if not await async_navigate(page, url, "a[href]", timeout_time, max_retry + 1):
+        return []
+
+    try:
+        urls = await page.eval_on_selector_all(
+            "a",
+            "elems => elems.map(elem => elem.href)"
+        )
+
+        return urls
+    except Exception as e:
+        print(f"{e}")
+
+    return []
+
+async def crawl(browser_connection, source_hubs, page_count, context_count, max_in_flight, max_per_host, state=None):
+    if state is None:
+        state = LocalCrawlState()
+
+    found_urls = set()
+    found_pdfs = set()
+    excluded_urls = set()
+
+    async with async_playwright() as p:
+        browser = await async_connect_browser(p, browser_connection)
+        pool = PagePool(browser, page_count, context_count)
+        await pool.open()
+        reconnect_lock = asyncio.Lock()
+
+        async def ensure_browser():
+            """Replaces the browser and its page pool when the instance died mid crawl."""
+            nonlocal browser, pool
+
+            async with reconnect_lock:
+                if browser.is_connected():
+                    return
+
+                print("Browser connection lost, failing over to another instance")
+                browser = await async_connect_browser(p)
+                pool = PagePool(browser, page_count, context_count)
+                await pool.open()
+
+        in_flight = asyncio.Semaphore(max(1, max_in_flight))
+        host_limiter = HostLimiter(max_per_host)
+
+        frontier = Frontier(is_allowed=is_allowed)
+        for curr_item in source_hubs:
+            frontier.push(curr_item)
+
+        # static fetches do not take a browser slot, so allow more visits than navigations
+        max_visits = max(1, max_in_flight) * 2
+        active = set()
+        # (url, depth) of hubs whose children were all enqueued
+        expanded_hubs = []
+
+        async def visit(curr_item, curr_source):
+            print(f"CRAWLING {curr_source}")
+            curr_source_parsed = urlparse(curr_source)
+
+            # take the host slot first so a busy host never holds a global slot while waiting
+            async with host_limiter.for_host(curr_source_parsed.netloc):
+                cached_hub = await asyncio.to_thread(load_hub, curr_source)
+                urls, static_urls, tier, validators = await asyncio.to_thread(
+                    try_static_fetch, curr_source, validator_headers(cached_hub)
+                )
+
+                if validators.get("not_modified") and cached_hub is not None:
+                    await asyncio.to_thread(refresh_hub, curr_source)
+                    urls, expand = cached_hub["urls"], should_expand(cached_hub, False, curr_item["depth"])
+                else:
+                    if urls is None:
+                        async with in_flight:
+                            if not browser.is_connected():
+                                await ensure_browser()
+
+                            # pages go back to the pool they came from, even if it was replaced meanwhile
+                            page_pool = pool
+                            page = await page_pool.acquire()
+                            try:
+                                urls = await async_retrieve_urls(page, curr_source, 5000, 2)
+                            finally:
+                                page_pool.release(page)
+
+                        await asyncio.to_thread(record_browser_fallback, curr_source, static_urls, urls, tier)
+
+                    changed = await asyncio.to_thread(store_hub, curr_source, urls, validators, cached_hub)
+                    expand = should_expand(cached_hub, changed, curr_item["depth"])
+
+            # runs in a thread since it may fetch robots.txt of hosts seen for the first time,
+            # which also leaves their rules in memory for the frontier
+            child_hubs = await asyncio.to_thread(
+                analyze_urls, curr_item, curr_source_parsed, urls, found_urls, found_pdfs, excluded_urls
+            )
+
+            # an unchanged hub that was expanded before cannot lead to anything new
+            if not expand:
+                return (curr_source, curr_item, None)
+
+            return (curr_source, curr_item, child_hubs)
+
+        try:
+            while len(frontier) > 0 or len(active) > 0:
+                while len(frontier) > 0 and len(active) < max_visits:
+                    curr_source, curr_item = frontier.pop()
+
+                    # another worker of a distributed run may have crawled it already
+                    if not await asyncio.to_thread(state.claim, curr_source):
+                        continue
+
+                    active.add(asyncio.create_task(visit(curr_item, curr_source)))
+
+                if len(active) == 0:
+                    break
+
+                done, active = await asyncio.wait(active, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        print(f"{task.exception()}")
+                        continue
+
+                    curr_source, curr_item, child_hubs = task.result()
+                    if child_hubs is not None and frontier.push_children(child_hubs, hub_priority):
+                        expanded_hubs.append((curr_source, curr_item["depth"]))
+        except Exception as e:
+            # e.g. redis failing in state.claim or a failover that found no instance
+            print(f"Crawl stopped early, keeping what was found so far: {e}")
+            # children that were enqueued may never have been crawled
+            expanded_hubs = []
+        finally:
+            for task in active:
+                task.cancel()
+            await pool.close()
+            await browser.close()
+
+    await asyncio.to_thread(mark_expanded, expanded_hubs)
+    frontier.report()
+    print(f"Scraping complete! Found {len(found_urls)} potential news URLs and {len(found_pdfs)} pdfs!")
+    return (list(found_urls), list(found_pdfs), list(excluded_urls - found_urls))
+
+def run_crawl(browser, source_hubs, state=None):
+    """
+    Reads FEED sources from their sitemaps and feeds, then crawls every source that is
+    left with the async engine. Returns the usual (found_urls, found_pdfs, excluded) tuple.
+    """
+    feed_urls = set()
+    feed_pdfs = set()
+    crawl_hubs = collect_feed_sources(source_hubs, feed_urls, feed_pdfs)
+
+    found_urls, found_pdfs, excluded_urls = [], [], []
+    if len(crawl_hubs) > 0:
+        # the sync playwright session of browser_session.py leaves its event loop registered
+        # as running in the worker's thread, so the crawl gets a thread and loop of its own
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                found_urls, found_pdfs, excluded_urls = executor.submit(asyncio.run, crawl(
+                    browser,
+                    crawl_hubs,
+                    CRAWLER_PAGE_POOL_SIZE,
+                    CRAWLER_CONTEXT_COUNT,
+                    CRAWLER_MAX_IN_FLIGHT,
+                    CRAWLER_MAX_PER_HOST,
+                    state
+                )).result()
+        except Exception as e:
+            # no browser could be connected or the page pool did not open, the feeds still count
+            print(f"Crawl failed, keeping the urls read from feeds: {e}")
+
+    found_urls = feed_urls.union(found_urls)
+    found_pdfs = feed_pdfs.union(found_pdfs)
+
+    return (list(found_urls), list(found_pdfs), list(set(excluded_urls) - found_urls))
+
+@shared_task
+def async_scrape_links(browser, source_hubs):
+    """
+    Concurrent version of scrape_links. Hub pages are crawled through a pool of pages
+    with a cap on in-flight navigations overall and per host.
+    """
+    return run_crawl(browser, source_hubs)
+
+@shared_task
+def crawl_source(browser, source_hub, run_id):
+    """
+    Crawls a single source hub as part of a distributed run. The visited set is
+    shared through redis so a page reached from two sources is only crawled once.
+    """
+    source = f"{source_hub['netloc']}{source_hub['path']}"
+    found_urls, found_pdfs, excluded_urls = [], [], []
+
+    # the run is a chord, so a source that raises would keep every other source from being merged
+    try:
+        state = RedisCrawlState(run_id)
+        found_urls, found_pdfs, excluded_urls = run_crawl(browser, [source_hub], state)
+        state.add_results(found_urls, found_pdfs, excluded_urls)
+    except Exception as e:
+        print(f"Crawl of {source} failed, merging the run without it: {e}")
+
+    return (len(found_urls), len(found_pdfs))
+
+@shared_task
+def merge_crawl_results(source_counts, run_id):
+    """
+    Runs once every crawl_source task of the run has finished and returns the
+    merged (found_urls, found_pdfs, excluded) tuple for process_url_list.
+    """
+    state = RedisCrawlState(run_id)
+    discovered_paths = state.results()
+    state.clear()
+
+    print(f"Merged {len(source_counts)} source crawls: {len(discovered_paths[0])} urls, {len(discovered_paths[1])} pdfs")
+    return discovered_paths
@@ -1,41 +1,65 @@
+import os
+import time
+
 from celery import shared_task
 
-from playwright.sync_api import sync_playwright
+from scraper.wait_strategy import navigate
+from scraper.seen_index import mark_rejected
+from scraper.robots import is_allowed
+from scraper.browser_session import browser_session
+from scraper.snapshots import capture_snapshot, store_snapshot
+from scraper.extraction import extract_articles, MIN_ARTICLE_WORDS
+from scraper.batch_planner import record_batch_time
 
-def playwright_retrieve_paragraphs(page, url, timeout_time, max_retry):
-    for _ in range(max_retry):
-        try:
-            page.goto(url, wait_until="networkidle", timeout=timeout_time)
-            p_tags = page.eval_on_selector_all("p", "elements => elements.map(el => el.innerText)")
-            texts = [p.strip() for p in p_tags]
-            texts = list(filter(lambda p: len(p.split()) > 3, texts))
+# text a page has to show before it is snapshotted, somewhat below what the 200 word gate needs
+FILTER_MIN_TEXT_CHARS = int(os.environ.get("FILTER_MIN_TEXT_CHARS", 1000))
 
-            return " ".join(texts)
+def playwright_retrieve_html(page, url, timeout_time, max_retry):
+    if not navigate(page, url, "p", timeout_time, max_retry, FILTER_MIN_TEXT_CHARS):
+        return None
 
-        except TimeoutError:
-            continue
-        except Exception as e:
-            print(e)
-            return ""
+    return capture_snapshot(page)
+
+def article_content(article):
+    """The text handed to classification, the title leads because it says the most per word."""
+    if article["title"] == "":
+        return article["text"]
+
+    return f"{article['title']}\n\n{article['text']}"
 
 @shared_task
 def filter_scraped_urls(batch):
     url_batch, browser_connection = batch
     urls = []
     page_contents = []
+    rejected_urls = []
+
+    start = time.monotonic()
+    fetched_urls = []
+    htmls = []
+    for url in url_batch:
+        if not is_allowed(url):
+            continue
 
-    with sync_playwright() as p:
-        browser = p.chromium.connect_over_cdp(browser_connection)
-        page = browser.new_page()
+        with browser_session.page(browser_connection, blocked=True) as page:
+            html = playwright_retrieve_html(page, url, 10000, 3)
 
-        for url in url_batch:
-            page_content = playwright_retrieve_paragraphs(page, url, 10000, 3)
+        # a failed navigation is retried next run
+        if html is not None:
+            fetched_urls.append(url)
+            htmls.append(html)
 
-            if len(page_content.split()) > 200:
-                urls.append(url)
-                page_contents.append(page_content)
+    # extraction runs outside the browser, over the whole batch at once
+    for url, html, article in zip(fetched_urls, htmls, extract_articles(htmls)):
+        if len(article["text"].split()) > MIN_ARTICLE_WORDS:
+            # keep what was classified so retrieval can print it without loading the page again
+            store_snapshot(url, html)
+            urls.append(url)
+            page_contents.append(article_content(article))
+        else:
+            rejected_urls.append(url)
 
-        page.close()
-        browser.close()
+    mark_rejected(rejected_urls)
+    record_batch_time("page", len(url_batch), time.monotonic() - start)
 
     return (urls, page_contents)
@@ -0,0 +1,95 @@
+import os
+import json
+import math
+import time
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from scraper.browser_pool import healthy_browsers
+
+STATS_KEY = "batch:stats"
+PLANS_KEY = "batch:plans"
+PLAN_HISTORY = 200
+
+# how long one batch (one chain) should take, so a slow batch does not hold the run back
+BATCH_TARGET_SECONDS = float(os.environ.get("BATCH_TARGET_SECONDS", 300))
+# pages each chromium instance is trusted with at the same time
+BATCH_PAGES_PER_BROWSER = int(os.environ.get("BATCH_PAGES_PER_BROWSER", 4))
+BATCH_INSPECT_TIMEOUT = float(os.environ.get("BATCH_INSPECT_TIMEOUT", 2))
+# used until the first batches of a kind have been timed
+DEFAULT_SECONDS_PER_ITEM = {"page": 15.0, "pdf": 5.0}
+# weight of the newest measurement in the moving average
+SECONDS_PER_ITEM_SMOOTHING = 0.3
+
+def worker_concurrency(app):
+    """Returns the number of task slots over every live worker, 1 if no worker answers."""
+    try:
+        stats = app.control.inspect(timeout=BATCH_INSPECT_TIMEOUT).stats() or {}
+    except Exception as e:
+        print(f"Could not inspect workers: {e}")
+        return 1
+
+    concurrency = sum(worker.get("pool", {}).get("max-concurrency", 1) for worker in stats.values())
+    return max(1, concurrency)
+
+def browser_slots():
+    return max(1, len(healthy_browsers()) * BATCH_PAGES_PER_BROWSER)
+
+def seconds_per_item(kind):
+    try:
+        value = establish_redis_connection().hget(STATS_KEY, f"{kind}:seconds_per_item")
+    except Exception as e:
+        print(f"Could not read batch stats: {e}")
+        value = None
+
+    return DEFAULT_SECONDS_PER_ITEM[kind] if value is None else float(value)
+
+def record_batch_time(kind, item_count, elapsed):
+    """
+    Folds the fetch stage of a finished batch into the moving average of seconds per item
+    the planner sizes batches with.
+    """
+    if item_count == 0:
+        return
+
+    measured = elapsed / item_count
+    previous = seconds_per_item(kind)
+    smoothed = SECONDS_PER_ITEM_SMOOTHING * measured + (1 - SECONDS_PER_ITEM_SMOOTHING) * previous
+
+    try:
+        establish_redis_connection().hset(STATS_KEY, f"{kind}:seconds_per_item", smoothed)
+    except Exception as e:
+        print(f"Could not record batch stats: {e}")
+
+def plan_batches(kind, item_count, concurrency, slots=None):
+    """
+    Decides how many batches item_count items are split into. Batches are kept small enough
+    to finish within BATCH_TARGET_SECONDS and numerous enough to use every worker slot,
+    or every browser slot for kinds that need a browser.
+    """
+    per_item = seconds_per_item(kind)
+    parallelism = concurrency if slots is None else min(concurrency, slots)
+
+    max_batch_size = max(1, int(BATCH_TARGET_SECONDS // per_item))
+    batch_count = max(math.ceil(item_count / max_batch_size), min(parallelism, item_count))
+
+    plan = {
+        "kind": kind,
+        "time": time.time(),
+        "items": item_count,
+        "concurrency": concurrency,
+        "browser_slots": slots,
+        "seconds_per_item": round(per_item, 2),
+        "batch_count": batch_count,
+        "batch_size": 0 if batch_count == 0 else math.ceil(item_count / batch_count),
+    }
+    print(f"Batch plan: {plan}")
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.lpush(PLANS_KEY, json.dumps(plan))
+        pipe.ltrim(PLANS_KEY, 0, PLAN_HISTORY - 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not log batch plan: {e}")
+
+    return batch_count
@@ -0,0 +1,113 @@
+import os
+import socket
+
+import requests
+
+# comma separated host:port list, when empty every address the BROWSER_HOST name resolves to is used
+BROWSER_ENDPOINTS = list(filter(None, os.environ.get("BROWSER_ENDPOINTS", "").split(",")))
+BROWSER_HOST = os.environ.get("BROWSER_HOST", "browser")
+BROWSER_PORT = int(os.environ.get("BROWSER_PORT", 9222))
+BROWSER_HEALTH_TIMEOUT = float(os.environ.get("BROWSER_HEALTH_TIMEOUT", 3))
+
+def discover_endpoints():
+    """Returns the host:port of every chromium instance, from config or from DNS."""
+    if len(BROWSER_ENDPOINTS) > 0:
+        return BROWSER_ENDPOINTS
+
+    try:
+        # a scaled compose service resolves to one address per replica
+        _, _, addresses = socket.gethostbyname_ex(BROWSER_HOST)
+    except socket.gaierror as e:
+        print(f"DNS resolution failed: {e}")
+        return []
+
+    return [f"{address}:{BROWSER_PORT}" for address in sorted(set(addresses))]
+
+def check_endpoint(endpoint):
+    """
+    Returns {"endpoint", "ws_url", "load"} for a healthy instance or None. The load is the
+    number of pages currently open on it.
+    """
+    try:
+        version = requests.get(f"http://{endpoint}/json/version", timeout=BROWSER_HEALTH_TIMEOUT)
+        ws_url = version.json()["webSocketDebuggerUrl"]
+
+        targets = requests.get(f"http://{endpoint}/json/list", timeout=BROWSER_HEALTH_TIMEOUT).json()
+        load = len([target for target in targets if target.get("type") == "page"])
+    except Exception as e:
+        print(f"Browser {endpoint} is unhealthy: {e}")
+        return None
+
+    return {"endpoint": endpoint, "ws_url": ws_url, "load": load}
+
+def healthy_browsers():
+    """Returns every healthy instance, least loaded first."""
+    browsers = [check_endpoint(endpoint) for endpoint in discover_endpoints()]
+    browsers = [browser for browser in browsers if browser is not None]
+
+    return sorted(browsers, key=lambda browser: browser["load"])
+
+def pick_browser():
+    """Returns the websocket url of the least loaded healthy instance, or None if none is up."""
+    browsers = healthy_browsers()
+    if len(browsers) == 0:
+        return None
+
+    return browsers[0]["ws_url"]
+
+def assign_browsers(task_count):
+    """
+    Spreads task_count tasks over the healthy instances, always giving the next task to
+    the instance with the lowest load so far. Returns one websocket url per task.
+    """
+    browsers = healthy_browsers()
+    if len(browsers) == 0:
+        return [None] * task_count
+
+    loads = [browser["load"] for browser in browsers]
+    assignments = []
+    for _ in range(task_count):
+        i = loads.index(min(loads))
+        assignments.append(browsers[i]["ws_url"])
+        loads[i] += 1
+
+    return assignments
+
+def connect_browser(playwright, preferred=None):
+    """
+    Connects to the preferred instance over CDP and fails over to the other healthy
+    instances, least loaded first, when it is down. Raises ConnectionError when no instance accepts.
+    """
+    if preferred is not None:
+        try:
+            return playwright.chromium.connect_over_cdp(preferred)
+        except Exception as e:
+            print(f"Could not connect to browser {preferred}: {e}")
+
+    for browser in healthy_browsers():
+        if browser["ws_url"] == preferred:
+            continue
+        try:
+            return playwright.chromium.connect_over_cdp(browser["ws_url"])
+        except Exception as e:
+            print(f"Could not connect to browser {browser['ws_url']}: {e}")
+
+    raise ConnectionError("No browser instance is available")
+
+async def async_connect_browser(playwright, preferred=None):
+    """Async api version of connect_browser."""
+    if preferred is not None:
+        try:
+            return await playwright.chromium.connect_over_cdp(preferred)
+        except Exception as e:
+            print(f"Could not connect to browser {preferred}: {e}")
+
+    for browser in healthy_browsers():
+        if browser["ws_url"] == preferred:
+            continue
+        try:
+            return await playwright.chromium.connect_over_cdp(browser["ws_url"])
+        except Exception as e:
+            print(f"Could not connect to browser {browser['ws_url']}: {e}")
+
+    raise ConnectionError("No browser instance is available")
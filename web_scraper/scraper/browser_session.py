@@ -0,0 +1,140 @@
+import os
+from contextlib import contextmanager
+
+from celery.signals import worker_process_shutdown
+from playwright.sync_api import sync_playwright
+
+from scraper.browser_pool import connect_browser
+from scraper.interception import block_resources
+
+# a page is closed and replaced after this many navigations or once its js heap grows past this size
+PAGE_MAX_NAVIGATIONS = int(os.environ.get("PAGE_MAX_NAVIGATIONS", 50))
+PAGE_MAX_HEAP_MB = int(os.environ.get("PAGE_MAX_HEAP_MB", 256))
+PAGE_POOL_SIZE = int(os.environ.get("PAGE_POOL_SIZE", 2))
+
+class BrowserSession:
+    """
+    Keeps the playwright driver and the CDP connections of a worker process alive across
+    tasks, so a task only pays for a page instead of a driver start and a connect. There is
+    one connection per instance tasks are assigned to (see assign_browsers), so a task runs
+    on the instance it was given and not on whichever the worker connected to first.
+    Pages are reused and recycled after PAGE_MAX_NAVIGATIONS navigations or when they grow too big.
+    """
+
+    def __init__(self):
+        self.playwright = None
+        # websocket url a task asked for -> browser connected for it, None meaning any instance
+        self.browsers = {}
+        # idle pages by (websocket url, whether requests are blocked on them)
+        self.idle_pages = {}
+        self.navigations = {}
+
+    def connect(self, preferred=None):
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+
+        browser = self.browsers.get(preferred)
+        if browser is None or not browser.is_connected():
+            if browser is not None:
+                print("Browser connection lost, reconnecting")
+                self.forget_pages(preferred)
+            browser = connect_browser(self.playwright, preferred)
+            self.browsers[preferred] = browser
+
+        return browser
+
+    def forget_pages(self, preferred):
+        """Forgets the idle pages of a connection that died, they went with it."""
+        for blocked in (True, False):
+            for page in self.idle_pages.pop((preferred, blocked), []):
+                self.navigations.pop(page, None)
+
+    def new_page(self, browser, blocked):
+        page = browser.new_page()
+        if blocked:
+            block_resources(page)
+
+        self.navigations[page] = 0
+
+        def count_navigation(frame):
+            # the about:blank a page is reset to on release is not a site navigation
+            if frame == page.main_frame and frame.url != "about:blank":
+                self.navigations[page] = self.navigations.get(page, 0) + 1
+
+        page.on("framenavigated", count_navigation)
+        return page
+
+    def heap_size_mb(self, page):
+        try:
+            used = page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+            return used / (1024 * 1024)
+        except Exception:
+            return 0
+
+    def should_recycle(self, page):
+        if page.is_closed():
+            return True
+        if self.navigations.get(page, 0) >= PAGE_MAX_NAVIGATIONS:
+            return True
+
+        return self.heap_size_mb(page) >= PAGE_MAX_HEAP_MB
+
+    def close_page(self, page):
+        self.navigations.pop(page, None)
+        try:
+            if not page.is_closed():
+                page.close()
+        except Exception as e:
+            print(e)
+
+    @contextmanager
+    def page(self, preferred=None, blocked=False):
+        """
+        Lends a page for the duration of the block. blocked pages abort the resources
+        the crawl and text extraction stages do not need (see scraper.interception).
+        """
+        browser = self.connect(preferred)
+
+        idle = self.idle_pages.setdefault((preferred, blocked), [])
+        page = idle.pop() if len(idle) > 0 else self.new_page(browser, blocked)
+
+        try:
+            yield page
+        finally:
+            if not browser.is_connected() or self.should_recycle(page) or len(idle) >= PAGE_POOL_SIZE:
+                self.close_page(page)
+            else:
+                # leave the last site behind so it stops running scripts while idle
+                try:
+                    page.goto("about:blank")
+                    idle.append(page)
+                except Exception:
+                    self.close_page(page)
+
+    def close(self):
+        for pages in self.idle_pages.values():
+            for page in pages:
+                self.close_page(page)
+        self.idle_pages = {}
+
+        for browser in self.browsers.values():
+            try:
+                browser.close()
+            except Exception as e:
+                print(e)
+
+        try:
+            if self.playwright is not None:
+                self.playwright.stop()
+        except Exception as e:
+            print(e)
+
+        self.browsers = {}
+        self.playwright = None
+
+# one session per worker process, started lazily by the first task that needs a page
+browser_session = BrowserSession()
+
+@worker_process_shutdown.connect
+def close_browser_session(**kwargs):
+    browser_session.close()
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import hashlib
+
+from shared.core_lib.redis_utils import establish_redis_connection
+
+# cached key -> last time it was read or written, the least recently used entries are evicted first
+LRU_KEY = "maizey:cache:lru"
+
+CLASSIFICATION_CACHE_TTL = int(os.environ.get("CLASSIFICATION_CACHE_TTL", 60 * 60 * 24 * 30))
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.environ.get("CLASSIFICATION_CACHE_MAX_ENTRIES", 50000))
+CLASSIFICATION_STATS_TTL = int(os.environ.get("CLASSIFICATION_STATS_TTL", 60 * 60 * 24 * 7))
+
+def config_version(categories_config):
+    """
+    Identifies the category setup a verdict was made under. A new category, threshold or
+    maizey project gives a new version, so nothing cached under the old one is used.
+    """
+    digest = hashlib.sha1()
+    digest.update(os.environ.get("MAIZEY_PROJECT_PK", "").encode("utf-8"))
+    digest.update(json.dumps(categories_config, sort_keys=True).encode("utf-8"))
+
+    return digest.hexdigest()[:12]
+
+def normalize_content(content):
+    return " ".join(content.lower().split())
+
+def cache_key(content, version):
+    digest = hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+    return f"maizey:cache:{version}:{digest}"
+
+def stats_key(run_id):
+    return f"maizey:cache:stats:{run_id}"
+
+def count(run_id, field):
+    if run_id is None:
+        return
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.hincrby(stats_key(run_id), field, 1)
+        pipe.expire(stats_key(run_id), CLASSIFICATION_STATS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not count classification cache {field}: {e}")
+
+def load_classification(content, version, run_id=None):
+    """Returns the parsed category list maizey gave for the same content before, or None."""
+    key = cache_key(content, version)
+
+    try:
+        redis_conn = establish_redis_connection()
+        cached = redis_conn.get(key)
+        if cached is not None:
+            pipe = redis_conn.pipeline()
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.expire(key, CLASSIFICATION_CACHE_TTL)
+            pipe.execute()
+    except Exception as e:
+        print(f"Could not read classification cache: {e}")
+        cached = None
+
+    count(run_id, "misses" if cached is None else "hits")
+
+    return None if cached is None else json.loads(cached)
+
+def store_classification(content, version, categories):
+    key = cache_key(content, version)
+
+    try:
+        redis_conn = establish_redis_connection()
+        pipe = redis_conn.pipeline()
+        pipe.set(key, json.dumps(categories), ex=CLASSIFICATION_CACHE_TTL)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+
+        # entries that already expired stay in the index until they are the oldest, deleting them is harmless
+        overflow = size - CLASSIFICATION_CACHE_MAX_ENTRIES
+        evicted = redis_conn.zpopmin(LRU_KEY, overflow) if overflow > 0 else []
+        if len(evicted) > 0:
+            redis_conn.delete(*[evicted_key for evicted_key, _ in evicted])
+    except Exception as e:
+        print(f"Could not write classification cache: {e}")
+
+def run_stats(run_id):
+    """Returns (hits, misses) of the classification cache over a run."""
+    try:
+        stats = establish_redis_connection().hgetall(stats_key(run_id))
+    except Exception as e:
+        print(f"Could not read classification cache stats: {e}")
+        return (0, 0)
+
+    return (int(stats.get("hits", 0)), int(stats.get("misses", 0)))
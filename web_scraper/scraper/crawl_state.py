@@ -0,0 +1,68 @@
+import os
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import canonicalize_url
+
+# crawl keys are dropped after this long even if the merge step never runs
+CRAWL_STATE_TTL = int(os.environ.get("CRAWL_STATE_TTL", 60 * 60 * 24))
+
+class LocalCrawlState:
+    """Visited set for a crawl that runs inside a single task."""
+
+    def __init__(self):
+        self.processed_urls = set()
+
+    def claim(self, url):
+        """Returns True the first time a url is claimed, False afterwards."""
+        url = canonicalize_url(url)
+        if url in self.processed_urls:
+            return False
+
+        self.processed_urls.add(url)
+        return True
+
+class RedisCrawlState:
+    """
+    Visited set and results for a crawl that is split across many workers.
+    Every key lives under crawl:<run_id> so concurrent runs do not collide.
+    """
+
+    def __init__(self, run_id, conn=None):
+        self.run_id = run_id
+        self.conn = conn if conn is not None else establish_redis_connection()
+
+    def key(self, name):
+        return f"crawl:{self.run_id}:{name}"
+
+    def claim(self, url):
+        key = self.key("processed")
+        pipe = self.conn.pipeline()
+        pipe.sadd(key, canonicalize_url(url))
+        pipe.expire(key, CRAWL_STATE_TTL)
+        added, _ = pipe.execute()
+
+        return added == 1
+
+    def add_results(self, found_urls, found_pdfs, excluded_urls):
+        pipe = self.conn.pipeline()
+        for name, urls in (("found_urls", found_urls), ("found_pdfs", found_pdfs), ("excluded", excluded_urls)):
+            if len(urls) == 0:
+                continue
+            pipe.sadd(self.key(name), *urls)
+            pipe.expire(self.key(name), CRAWL_STATE_TTL)
+        pipe.execute()
+
+    def results(self):
+        found_urls = self.conn.smembers(self.key("found_urls"))
+        found_pdfs = self.conn.smembers(self.key("found_pdfs"))
+        excluded_urls = self.conn.smembers(self.key("excluded"))
+
+        return (list(found_urls), list(found_pdfs), list(excluded_urls - found_urls))
+
+    def clear(self):
+        self.conn.delete(
+            self.key("processed"),
+            self.key("found_urls"),
+            self.key("found_pdfs"),
+            self.key("excluded")
+        )
@@ -1,25 +1,27 @@
 from celery import shared_task
 from urllib.parse import urlparse, urlunparse
 
-from playwright.sync_api import sync_playwright
+from shared.core_lib.url_utils import same_site
+
+from scraper.wait_strategy import navigate
+from scraper.static_fetch import try_static_fetch, record_browser_fallback
+from scraper.url_classifier import classify_urls
+from scraper.robots import is_allowed
+from scraper.browser_session import browser_session
+from scraper.frontier import Frontier, source_key
+from scraper.hub_cache import load_hub, validator_headers, store_hub, refresh_hub, should_expand, mark_expanded
 
 def build_url(current_url, scraped_url):
-    return urlunparse(("https", current_url.netloc, scraped_url.path, '', '', ''))
+    # relative links keep the host of the page they were found on. the url is navigated as
+    # it was discovered, the canonical form is only used as a key
+    netloc = scraped_url.netloc if scraped_url.netloc != '' else current_url.netloc
+    return urlunparse(("https", netloc, scraped_url.path, '', scraped_url.query, ''))
 
 def same_domain(netloc1, netloc2):
     if netloc1 == '' or netloc2 == '':
         return True
 
-    domain_levels1 = netloc1.split('.')
-    domain_levels2 = netloc2.split('.')
-
-    try:
-        same_top_domain = domain_levels1[-1] == domain_levels2[-1]
-        same_second_domain = domain_levels1[-2] == domain_levels2[-2]
-    except:
-        return False
-
-    return same_top_domain and same_second_domain
+    return same_site(netloc1, netloc2)
 
 def analyze_last_path(chunk):
     words = chunk.split("-")
@@ -55,24 +57,11 @@ def is_pdf(path):
     return trimmed.endswith(".pdf")
 
 def playwright_retrieve_urls(page, url, timeout_time, max_retry):
-    for _ in range(max_retry):
-        try:
-            page.goto(url, wait_until="networkidle", timeout=timeout_time)
-            urls = page.eval_on_selector_all(
-                "a",
-                "elems => elems.map(elem => elem.href)"
-            )
-
-            return urls
-
-        except TimeoutError:
-            continue
-        except Exception as e:
-            print(f"{e} RETRYING ...")
-            continue
+    # max_retry attempts plus the old "load" fallback attempt
+    if not navigate(page, url, "a[href]", timeout_time, max_retry + 1):
+        return []
 
     try:
-        page.goto(url, wait_until="load", timeout=timeout_time)
         urls = page.eval_on_selector_all(
             "a",
             "elems => elems.map(elem => elem.href)"
@@ -84,68 +73,112 @@ def playwright_retrieve_urls(page, url, timeout_time, max_retry):
 
     return []
 
-@shared_task
-def scrape_links(browser, source_hubs):
-    processed_urls = set()
+def retrieve_urls(page, url, timeout_time, max_retry, depth):
+    """
+    Collects the links of a hub page and returns (urls, expand). A plain http fetch is used
+    when the host allows it and the browser only when the static html is not good enough.
+    Hubs whose links did not change since a run that crawled their children at least depth
+    deep come back with expand set to False.
+    """
+    cached_hub = load_hub(url)
+
+    urls, static_urls, tier, validators = try_static_fetch(url, validator_headers(cached_hub))
+    if validators.get("not_modified") and cached_hub is not None:
+        refresh_hub(url)
+        return (cached_hub["urls"], should_expand(cached_hub, False, depth))
+
+    if urls is None:
+        urls = playwright_retrieve_urls(page, url, timeout_time, max_retry)
+        record_browser_fallback(url, static_urls, urls, tier)
+
+    changed = store_hub(url, urls, validators, cached_hub)
+    return (urls, should_expand(cached_hub, changed, depth))
+
+def analyze_urls(curr_item, curr_source_parsed, urls, found_urls, found_pdfs, excluded_urls):
+    """
+    Sorts the links scraped from a hub page into news urls, pdfs and excluded urls.
+    Returns the list of child hubs that should be crawled next.
+    """
+    child_hubs = []
+    candidates = []
+
+    for url in urls:
+        scraped_url_parsed = urlparse(url)
+
+        if not same_domain(scraped_url_parsed.netloc, curr_source_parsed.netloc):
+            continue
 
-    found_urls = set()
-    found_pdfs = set()
-    excluded_urls = set()
+        built_url = build_url(curr_source_parsed, scraped_url_parsed)
 
-    with sync_playwright() as p:
-        # initialize browser and page for crawling
-        browser = p.chromium.connect_over_cdp(browser)
-        page = browser.new_page()
+        # Respect the target_type for the source
+        target_type = curr_item.get("target", "BOTH")
+        is_pdf_target = is_pdf(scraped_url_parsed.path)
 
-        while len(source_hubs) > 0:
-            # grab an item from the queue
-            curr_item = source_hubs.pop()
-            curr_source = urlunparse(("https", curr_item["netloc"], curr_item["path"], '', '', ''))
-            if curr_item["depth"] <= 0:
-                continue
-            if curr_source in processed_urls:
+        if is_pdf_target and target_type in ["PDF", "BOTH"]:
+            if built_url not in found_pdfs and is_allowed(built_url):
+                found_pdfs.add(built_url)
                 continue
-            print(f"CRAWLING {curr_source}")
-            
-            processed_urls.add(curr_source)
 
-            curr_source_parsed = urlparse(curr_source)
+        child_hubs.append({
+            "netloc": scraped_url_parsed.netloc or curr_source_parsed.netloc,
+            "path": scraped_url_parsed.path,
+            "depth": curr_item["depth"] - 1,
+            "target": curr_item["target"],
+            "source": source_key(curr_item)
+        })
+
+        if built_url not in found_urls and built_url not in excluded_urls:
+            candidates.append(built_url)
+
+    # disallowed articles are dropped before they cost a navigation in the filter stage
+    candidates = [url for url in dict.fromkeys(candidates) if is_allowed(url)]
+
+    # every candidate of the hub is scored in a single batch
+    is_news = classify_urls(candidates, probably_news)
+    target_type = curr_item.get("target", "BOTH")
 
-            urls = playwright_retrieve_urls(page, curr_source, 5000, 2)
+    for built_url, news in zip(candidates, is_news):
+        if news and target_type in ["BOTH", "WEBSITE"]:
+            found_urls.add(built_url)
+        else:
+            excluded_urls.add(built_url)
 
-            # analyze the urls
-            for url in urls:
-                scraped_url_parsed = urlparse(url)
+    return child_hubs
 
-                if not same_domain(scraped_url_parsed.netloc, curr_source_parsed.netloc):
-                    continue
+def hub_priority(item):
+    """Section fronts make better hubs than articles, so article looking paths are crawled later."""
+    return 1 if probably_news(item["path"]) else 0
 
-                built_url = build_url(curr_source_parsed, scraped_url_parsed)
+@shared_task
+def scrape_links(browser, source_hubs):
+    frontier = Frontier(is_allowed=is_allowed)
+    for curr_item in source_hubs:
+        frontier.push(curr_item)
+
+    found_urls = set()
+    found_pdfs = set()
+    excluded_urls = set()
+    # (url, depth) of hubs whose children were all enqueued
+    expanded_hubs = []
 
-                # Respect the target_type for the source
-                target_type = curr_item.get("target", "BOTH")
-                is_pdf_target = is_pdf(scraped_url_parsed.path)
+    while len(frontier) > 0:
+        # grab the next hub from the frontier
+        curr_source, curr_item = frontier.pop()
+        print(f"CRAWLING {curr_source}")
 
-                if is_pdf_target and target_type in ["PDF", "BOTH"]:
-                    if built_url not in found_pdfs:
-                        found_pdfs.add(built_url)
-                        continue
+        curr_source_parsed = urlparse(curr_source)
 
-                source_hubs.append({
-                    "netloc": scraped_url_parsed.netloc,
-                    "path": scraped_url_parsed.path,
-                    "depth": curr_item["depth"] - 1,
-                    "target": curr_item["target"]
-                })
+        # pages come from the worker's long lived session, which reconnects if the instance died
+        with browser_session.page(browser, blocked=True) as page:
+            urls, expand = retrieve_urls(page, curr_source, 5000, 2, curr_item["depth"])
 
-                if probably_news(scraped_url_parsed.path) and target_type in ["BOTH", "WEBSITE"]:
-                    if built_url not in found_urls:
-                        found_urls.add(built_url)
-                elif built_url not in excluded_urls:
-                    excluded_urls.add(built_url)
+        child_hubs = analyze_urls(curr_item, curr_source_parsed, urls, found_urls, found_pdfs, excluded_urls)
 
-        page.close()
-        browser.close()
+        # an unchanged hub that was expanded before cannot lead to anything new
+        if expand and frontier.push_children(child_hubs, hub_priority):
+            expanded_hubs.append((curr_source, curr_item["depth"]))
 
+    mark_expanded(expanded_hubs)
+    frontier.report()
     print(f"Scraping complete! Found {len(found_urls)} potential news URLs and {len(found_pdfs)} pdfs!")
     return (list(found_urls), list(found_pdfs), list(excluded_urls - found_urls))
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+def parse_date(text):
+    """Parses the ISO 8601 dates of sitemaps/atom and the RFC 822 dates of RSS, returning an aware datetime."""
+    if text is None:
+        return None
+
+    text = text.strip()
+    if text == "":
+        return None
+
+    try:
+        date = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(text)
+        except (TypeError, ValueError):
+            return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return date
@@ -0,0 +1,324 @@
+import os
+import re
+import copy
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml.html
+from lxml import etree
+
+from scraper.dates import parse_date
+
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", os.cpu_count() or 1))
+# smaller batches are not worth starting processes for
+EXTRACTION_MIN_POOL_BATCH = int(os.environ.get("EXTRACTION_MIN_POOL_BATCH", 8))
+
+# never part of an article body
+STRIPPED_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "button", "select", "nav", "footer", "aside"]
+
+# class/id hints, weighted like readability does. negative hints drop whole subtrees, so they
+# only match complete words of a class or id: "share" and "share-bar" but not "shared-layout"
+POSITIVE_HINTS = re.compile(r"article|body|content|entry|main|post|story|text|blog", re.I)
+NEGATIVE_HINTS = re.compile(
+    r"(?<![a-z0-9])(?:banner|breadcrumb|comment|cookie|consent|footer|header|menu|modal|nav|navbar|navigation|"
+    r"newsletter|popup|promo|related|share|sidebar|social|sponsor|subscribe|tag|widget|advert|advertisement|ad)s?(?![a-z0-9])",
+    re.I
+)
+
+# pages whose body comes out shorter than this are rejected by the filter stage
+MIN_ARTICLE_WORDS = 200
+
+# elements that hold running text
+TEXT_BLOCK_TAGS = {"p", "pre", "blockquote", "li", "td", "h2", "h3", "h4"}
+BLOCK_TAGS = TEXT_BLOCK_TAGS | {"div", "section", "article", "main", "ul", "ol", "table", "h1", "header"}
+
+MIN_BLOCK_CHARS = 25
+MAX_LINK_DENSITY = 0.5
+
+DATE_META = ["article:published_time", "og:published_time", "datepublished", "pubdate", "publishdate", "date", "dc.date", "dc.date.issued", "sailthru.date", "parsely-pub-date"]
+AUTHOR_META = ["author", "article:author", "byl", "dc.creator", "parsely-author", "sailthru.author"]
+TITLE_META = ["og:title", "twitter:title"]
+
+def clean_text(text):
+    return " ".join(text.split())
+
+def node_text(node):
+    return clean_text(node.text_content())
+
+def link_density(node, text_length):
+    if text_length == 0:
+        return 1.0
+
+    link_length = sum(len(node_text(link)) for link in node.iter("a"))
+    return link_length / text_length
+
+def class_weight(node):
+    weight = 0
+    for hint in (node.get("class"), node.get("id")):
+        if not hint:
+            continue
+        if NEGATIVE_HINTS.search(hint):
+            weight -= 25
+        if POSITIVE_HINTS.search(hint):
+            weight += 25
+
+    return weight
+
+def is_text_block(node):
+    """Paragraph like elements, including divs used as paragraphs (no block children)."""
+    if node.tag in TEXT_BLOCK_TAGS:
+        return True
+
+    if node.tag == "div":
+        return not any(child.tag in BLOCK_TAGS for child in node)
+
+    return False
+
+def strip_tags(root):
+    etree.strip_elements(root, etree.Comment, *STRIPPED_TAGS, with_tail=False)
+
+def strip_boilerplate(root, keep):
+    """Drops the containers whose class or id says they are boilerplate, except the nodes in keep."""
+    for node in list(root.iter("div", "section", "ul", "header", "span", "p")):
+        if node.getparent() is None or node.tag in ("body", "html") or node in keep:
+            continue
+
+        hints = f"{node.get('class', '')} {node.get('id', '')}"
+        # a negative hint only removes the node when nothing says it is the content itself
+        if NEGATIVE_HINTS.search(hints) and not POSITIVE_HINTS.search(hints):
+            node.drop_tree()
+
+def score_candidates(root):
+    """
+    Scores every container by the text blocks directly beneath it. A block is worth more the
+    longer and more comma heavy its text is, half of that also goes to the grandparent.
+    """
+    scores = {}
+
+    for block in root.iter(*BLOCK_TAGS):
+        if not is_text_block(block):
+            continue
+
+        text = node_text(block)
+        if len(text) < MIN_BLOCK_CHARS:
+            continue
+
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+
+        parent = block.getparent()
+        if parent is None:
+            continue
+
+        for node, share in ((parent, 1.0), (parent.getparent(), 0.5)):
+            if node is None or not isinstance(node.tag, str):
+                continue
+            if node not in scores:
+                scores[node] = class_weight(node)
+            scores[node] += score * share
+
+    # a container mostly made of links is a menu or a list of teasers
+    for node in scores:
+        text_length = len(node_text(node))
+        scores[node] *= 1 - link_density(node, text_length)
+
+    return scores
+
+def collect_blocks(node):
+    texts = []
+    collected = set()
+    for block in node.iter(*BLOCK_TAGS):
+        if not is_text_block(block):
+            continue
+
+        # a paragraph inside a quote or a table cell that was already taken as a whole
+        if any(ancestor in collected for ancestor in block.iterancestors()):
+            continue
+
+        text = node_text(block)
+        if len(text.split()) <= 3:
+            continue
+        if link_density(block, len(text)) > MAX_LINK_DENSITY:
+            continue
+
+        texts.append(text)
+        collected.add(block)
+
+    return texts
+
+def best_candidate(root):
+    scores = score_candidates(root)
+    if len(scores) == 0:
+        return None
+
+    return max(scores, key=scores.get)
+
+def main_content(root):
+    scores = score_candidates(root)
+    if len(scores) == 0:
+        return []
+
+    top = max(scores, key=scores.get)
+
+    # article bodies are often split over sibling containers (ads in between, paywall wrappers)
+    threshold = max(10, scores[top] * 0.2)
+    parent = top.getparent()
+    siblings = [top] if parent is None else [child for child in parent if child is top or scores.get(child, 0) >= threshold]
+
+    texts = []
+    for node in siblings:
+        texts.extend(collect_blocks(node))
+
+    return texts
+
+def paragraph_text(root):
+    """What the filter stage used before extraction existed: every <p> of more than three words."""
+    texts = [node_text(p) for p in root.iter("p")]
+    return [text for text in texts if len(text.split()) > 3]
+
+def word_count(texts):
+    return sum(len(text.split()) for text in texts)
+
+def meta_content(root, names):
+    metas = {}
+    for meta in root.iter("meta"):
+        name = (meta.get("property") or meta.get("name") or meta.get("itemprop") or "").lower()
+        content = meta.get("content")
+        if name and content and name not in metas:
+            metas[name] = content.strip()
+
+    for name in names:
+        if metas.get(name):
+            return metas[name]
+
+    return None
+
+def json_ld_items(root):
+    for script in root.iter("script"):
+        if script.get("type") != "application/ld+json" or not script.text:
+            continue
+
+        try:
+            data = json.loads(script.text)
+        except ValueError:
+            continue
+
+        items = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        for item in items:
+            if isinstance(item, dict):
+                yield item
+
+def find_title(root):
+    title = meta_content(root, TITLE_META)
+    if title:
+        return clean_text(title)
+
+    for h1 in root.iter("h1"):
+        text = node_text(h1)
+        if text:
+            return text
+
+    titles = root.findall(".//title")
+    if len(titles) > 0:
+        return node_text(titles[0])
+
+    return ""
+
+def find_byline(root, ld_items):
+    byline = meta_content(root, AUTHOR_META)
+    if byline and not byline.startswith("http"):
+        return clean_text(byline)
+
+    for item in ld_items:
+        author = item.get("author")
+        if isinstance(author, list) and len(author) > 0:
+            author = author[0]
+        if isinstance(author, dict):
+            author = author.get("name")
+        if isinstance(author, str) and author.strip():
+            return clean_text(author)
+
+    for node in root.xpath('//*[@rel="author" or contains(@class, "byline") or contains(@class, "author")]'):
+        text = node_text(node)
+        if 0 < len(text) <= 100:
+            return text
+
+    return ""
+
+def find_published(root, ld_items):
+    date = parse_date(meta_content(root, DATE_META))
+
+    if date is None:
+        for item in ld_items:
+            published = item.get("datePublished")
+            date = parse_date(published) if isinstance(published, str) else None
+            if date is not None:
+                break
+
+    if date is None:
+        for time_tag in root.iter("time"):
+            date = parse_date(time_tag.get("datetime"))
+            if date is not None:
+                break
+
+    return None if date is None else date.isoformat()
+
+def extract_article(html):
+    """
+    Pulls the article out of a page's html without a browser. Returns {"title", "byline",
+    "published", "text"}, published being an ISO 8601 string or None. The body is the best
+    scoring container by text density and structure, without menus, banners and teaser lists.
+    """
+    empty = {"title": "", "byline": "", "published": None, "text": ""}
+    if html is None or html.strip() == "":
+        return empty
+
+    try:
+        root = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError) as e:
+        print(f"Could not parse page for extraction: {e}")
+        return empty
+
+    # metadata is read before the boilerplate (and the json-ld scripts with it) is stripped
+    ld_items = list(json_ld_items(root))
+    article = {
+        "title": find_title(root),
+        "byline": find_byline(root, ld_items),
+        "published": find_published(root, ld_items),
+    }
+
+    strip_tags(root)
+    unstripped = copy.deepcopy(root)
+
+    # the container that scores best before anything is dropped, and everything around it, stays
+    # even if a wrapper's class looks like boilerplate (e.g. "l-wrap has-sidebar")
+    top = best_candidate(root)
+    keep = set() if top is None else {top, *top.iterancestors()}
+    strip_boilerplate(root, keep)
+    texts = main_content(root)
+
+    # hints can still be wrong about a page, so a body too short to pass the filter stage
+    # is checked against the page without stripping and the plain <p> text before giving up
+    if word_count(texts) < MIN_ARTICLE_WORDS:
+        for fallback in (main_content(unstripped), paragraph_text(unstripped)):
+            if word_count(fallback) > word_count(texts):
+                texts = fallback
+
+    article["text"] = "\n".join(texts)
+
+    return article
+
+def extract_articles(htmls):
+    """
+    extract_article over a batch of pages, spread over EXTRACTION_WORKERS processes. Celery's
+    prefork workers are daemon processes, which may not start children, so those run it serially.
+    """
+    if len(htmls) < EXTRACTION_MIN_POOL_BATCH or EXTRACTION_WORKERS <= 1 or multiprocessing.current_process().daemon:
+        return [extract_article(html) for html in htmls]
+
+    try:
+        with ProcessPoolExecutor(max_workers=min(EXTRACTION_WORKERS, len(htmls))) as executor:
+            return list(executor.map(extract_article, htmls, chunksize=4))
+    except Exception as e:
+        print(f"Extraction pool failed, extracting serially: {e}")
+        return [extract_article(html) for html in htmls]
@@ -0,0 +1,222 @@
+import os
+import io
+import gzip
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin, urlparse, urlunparse
+
+import urllib3
+import requests
+import lxml.html
+from lxml import etree
+
+from scraper.crawler import same_domain, build_url, is_pdf
+from scraper.static_fetch import get_session, STATIC_FETCH_TIMEOUT
+from scraper.politeness import acquire, report_status
+from scraper.robots import is_allowed, load_rules
+from scraper.dates import parse_date
+
+FEED_MAX_AGE_DAYS = int(os.environ.get("FEED_MAX_AGE_DAYS", 7))
+FEED_MAX_DOCUMENTS = int(os.environ.get("FEED_MAX_DOCUMENTS", 50))
+FEED_INCLUDE_UNDATED = os.environ.get("FEED_INCLUDE_UNDATED", "False") == "True"
+
+# well known locations tried when robots.txt and the hub page do not advertise any feed
+FALLBACK_FEED_PATHS = ["/sitemap.xml", "/sitemap_index.xml", "/news-sitemap.xml", "/feed", "/rss"]
+
+FEED_CONTENT_TYPES = ["application/rss+xml", "application/atom+xml", "application/xml", "text/xml"]
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# what reading one feed can fail with, a broken feed is skipped instead of failing the crawl
+FEED_ERRORS = (OSError, urllib3.exceptions.HTTPError, requests.RequestException)
+
+def local_name(tag):
+    if not isinstance(tag, str):
+        return ""
+
+    return tag.rsplit("}", 1)[-1]
+
+def child_text(elem, name):
+    for child in elem.iter():
+        if local_name(child.tag) == name and child.text:
+            return child.text.strip()
+
+    return None
+
+def iter_feed_entries(stream):
+    """
+    Streams a sitemap, sitemap index, RSS or Atom document and yields (kind, url, date) tuples
+    where kind is "sitemap" for entries of a sitemap index and "page" for everything else.
+    Elements are cleared as soon as they are read so big sitemaps never sit in memory.
+    """
+    for _, elem in etree.iterparse(stream, events=("end",), recover=True, resolve_entities=False, no_network=True):
+        name = local_name(elem.tag)
+
+        if name == "url":
+            # news sitemaps carry the publication date in news:publication_date
+            date = child_text(elem, "publication_date") or child_text(elem, "lastmod")
+            yield ("page", child_text(elem, "loc"), parse_date(date))
+        elif name == "sitemap":
+            yield ("sitemap", child_text(elem, "loc"), parse_date(child_text(elem, "lastmod")))
+        elif name == "item":
+            date = child_text(elem, "pubDate") or child_text(elem, "date")
+            yield ("page", child_text(elem, "link"), parse_date(date))
+        elif name == "entry":
+            link = None
+            for child in elem:
+                if local_name(child.tag) == "link" and child.get("rel", "alternate") == "alternate":
+                    link = child.get("href")
+                    break
+            date = child_text(elem, "published") or child_text(elem, "updated")
+            yield ("page", link, parse_date(date))
+        else:
+            continue
+
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+def open_feed(url):
+    """Returns a file like object streaming the feed body, or None if it is not a feed."""
+    if not acquire(url):
+        return None
+
+    try:
+        response = get_session().get(url, timeout=STATIC_FETCH_TIMEOUT, stream=True)
+    except requests.RequestException as e:
+        print(f"Feed fetch failed for {url}: {e}")
+        return None
+
+    report_status(url, response.status_code, response.headers.get("Retry-After"))
+
+    if response.status_code // 100 != 2:
+        response.close()
+        return None
+
+    content_type = response.headers.get("Content-Type", "")
+    if "html" in content_type:
+        response.close()
+        return None
+
+    # a .gz sitemap served with Content-Encoding: gzip is already decoded by urllib3, so the
+    # body is only unzipped when it still starts with the gzip magic bytes
+    response.raw.decode_content = True
+    stream = io.BufferedReader(response.raw)
+    if stream.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+
+    return stream
+
+def discover_feeds(source):
+    """Collects the sitemaps advertised in robots.txt and the feeds linked from the hub page."""
+    root = urlunparse(("https", source["netloc"], "", '', '', ''))
+    hub = urlunparse(("https", source["netloc"], source["path"], '', '', ''))
+    feeds = []
+
+    # sitemaps advertised in robots.txt, read through the shared robots cache
+    feeds.extend(load_rules(source["netloc"]).site_maps() or [])
+
+    try:
+        response = None
+        if acquire(hub):
+            response = get_session().get(hub, timeout=STATIC_FETCH_TIMEOUT)
+            report_status(hub, response.status_code, response.headers.get("Retry-After"))
+        if response is not None and response.status_code // 100 == 2 and "html" in response.headers.get("Content-Type", ""):
+            document = lxml.html.fromstring(response.text)
+            for link in document.xpath("//link[@rel='alternate'][@href]"):
+                if link.get("type", "") in FEED_CONTENT_TYPES:
+                    feeds.append(urljoin(response.url, link.get("href")))
+    except (requests.RequestException, etree.ParserError, ValueError) as e:
+        print(f"Could not read feed links of {hub}: {e}")
+
+    if len(feeds) == 0:
+        feeds = [urljoin(root, path) for path in FALLBACK_FEED_PATHS]
+
+    return list(dict.fromkeys(feeds))
+
+def read_feed_urls(source, found_urls, found_pdfs):
+    """
+    Reads article urls of a source straight from its sitemaps and feeds, keeping only
+    entries newer than FEED_MAX_AGE_DAYS. Returns False when no feed could be read at all.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=FEED_MAX_AGE_DAYS)
+    source_netloc = source["netloc"]
+    target_type = source.get("target", "BOTH")
+
+    pending = discover_feeds(source)
+    visited = set()
+    any_feed = False
+
+    while len(pending) > 0 and len(visited) < FEED_MAX_DOCUMENTS:
+        feed_url = pending.pop()
+        if feed_url in visited:
+            continue
+        visited.add(feed_url)
+
+        try:
+            stream = open_feed(feed_url)
+        except FEED_ERRORS as e:
+            print(f"Could not read feed {feed_url}: {e}")
+            continue
+
+        if stream is None:
+            continue
+
+        print(f"READING FEED {feed_url}")
+        try:
+            for kind, url, date in iter_feed_entries(stream):
+                if url is None:
+                    continue
+
+                # a readable feed counts even if none of its entries are recent enough
+                any_feed = True
+
+                if date is not None and date < cutoff:
+                    continue
+
+                # sitemap indexes often leave out lastmod, so undated child sitemaps are still read
+                if kind == "sitemap":
+                    pending.append(url)
+                    continue
+
+                if date is None and not FEED_INCLUDE_UNDATED:
+                    continue
+
+                url_parsed = urlparse(url)
+                if not same_domain(url_parsed.netloc, source_netloc):
+                    continue
+
+                built_url = build_url(url_parsed, url_parsed)
+                if not is_allowed(built_url):
+                    continue
+
+                if is_pdf(url_parsed.path):
+                    if target_type in ["PDF", "BOTH"]:
+                        found_pdfs.add(built_url)
+                elif target_type in ["WEBSITE", "BOTH"]:
+                    found_urls.add(built_url)
+        except etree.XMLSyntaxError as e:
+            print(f"Could not parse feed {feed_url}: {e}")
+        except FEED_ERRORS as e:
+            print(f"Could not read feed {feed_url}: {e}")
+        finally:
+            stream.close()
+
+    return any_feed
+
+def collect_feed_sources(source_hubs, found_urls, found_pdfs):
+    """
+    Reads every FEED source from its feeds and returns the hubs that still need a browser
+    crawl: CRAWL sources plus FEED sources where no feed could be found.
+    """
+    crawl_hubs = []
+
+    for source in source_hubs:
+        if source.get("discovery", "CRAWL") != "FEED":
+            crawl_hubs.append(source)
+            continue
+
+        if not read_feed_urls(source, found_urls, found_pdfs):
+            print(f"No feeds found for {source['netloc']}{source['path']}, falling back to crawling")
+            crawl_hubs.append(source)
+
+    return crawl_hubs
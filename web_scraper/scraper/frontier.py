@@ -0,0 +1,124 @@
+import os
+import heapq
+import itertools
+from collections import defaultdict
+from urllib.parse import urlunparse
+
+from shared.core_lib.url_utils import canonicalize_url, registrable_domain
+
+FRONTIER_DOMAIN_BUDGET = int(os.environ.get("FRONTIER_DOMAIN_BUDGET", 500))
+FRONTIER_SOURCE_BUDGET = int(os.environ.get("FRONTIER_SOURCE_BUDGET", 300))
+
+def hub_url(item):
+    return urlunparse(("https", item["netloc"], item["path"], '', '', ''))
+
+def source_key(item):
+    return item.get("source", item["netloc"] + item["path"])
+
+class Frontier:
+    """
+    Priority queue of hub pages waiting to be crawled. Hubs are deduplicated when they are
+    enqueued, shallow hubs come out before deep ones and every domain and source has a
+    page budget so one large site cannot use up a whole run.
+    """
+
+    def __init__(self, domain_budget=FRONTIER_DOMAIN_BUDGET, source_budget=FRONTIER_SOURCE_BUDGET, is_allowed=None):
+        self.domain_budget = domain_budget
+        self.source_budget = source_budget
+        # optional url check (robots.txt) so disallowed hubs never cost a navigation
+        self.is_allowed = is_allowed
+
+        self.heap = []
+        self.seen = set()
+        self.order = itertools.count()
+
+        self.domain_pages = defaultdict(int)
+        self.source_pages = defaultdict(int)
+
+        self.pushed = 0
+        self.popped = 0
+        self.max_size = 0
+        self.drops = defaultdict(int)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def domain_of(self, item):
+        return registrable_domain(item["netloc"])
+
+    def push(self, item, priority=0):
+        """
+        Enqueues a hub and returns True if it was accepted. Lower priority values are
+        crawled first among hubs of the same depth.
+        """
+        if item["depth"] <= 0:
+            self.drops["depth"] += 1
+            return False
+
+        # hubs are navigated as discovered but deduplicated on their canonical url
+        url = hub_url(item)
+        key = canonicalize_url(url)
+        if key in self.seen:
+            self.drops["duplicate"] += 1
+            return False
+
+        if self.is_allowed is not None and not self.is_allowed(url):
+            self.seen.add(key)
+            self.drops["robots"] += 1
+            return False
+
+        domain = self.domain_of(item)
+        if self.domain_pages[domain] >= self.domain_budget:
+            self.drops["domain_budget"] += 1
+            return False
+
+        source = source_key(item)
+        if self.source_pages[source] >= self.source_budget:
+            self.drops["source_budget"] += 1
+            return False
+
+        self.seen.add(key)
+        self.domain_pages[domain] += 1
+        self.source_pages[source] += 1
+
+        # remaining depth is negated so the shallowest hubs (largest remaining depth) come first
+        heapq.heappush(self.heap, (-item["depth"], priority, next(self.order), url, item))
+        self.pushed += 1
+        self.max_size = max(self.max_size, len(self.heap))
+
+        return True
+
+    def pop(self):
+        """Returns the next (url, item) to crawl."""
+        _, _, _, url, item = heapq.heappop(self.heap)
+        self.popped += 1
+
+        return (url, item)
+
+    def budget_drops(self):
+        """Hubs turned away because their domain or source ran out of budget, they were never crawled."""
+        return self.drops["domain_budget"] + self.drops["source_budget"]
+
+    def push_children(self, children, priority):
+        """Enqueues the child hubs of a crawled hub, returns False if any of them did not fit a budget."""
+        budget_drops = self.budget_drops()
+        for child in children:
+            self.push(child, priority(child))
+
+        return self.budget_drops() == budget_drops
+
+    def stats(self):
+        return {
+            "size": len(self.heap),
+            "max_size": self.max_size,
+            "pushed": self.pushed,
+            "popped": self.popped,
+            "drops": dict(self.drops),
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"Frontier: {stats['pushed']} hubs enqueued, {stats['popped']} crawled, "
+            f"peak size {stats['max_size']}, dropped {stats['drops']}"
+        )
@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import canonicalize_url
+
+HUB_CACHE_TTL = int(os.environ.get("HUB_CACHE_TTL", 60 * 60 * 24 * 7))
+
+def hub_key(url):
+    return f"crawl:hub:{canonicalize_url(url)}"
+
+def links_hash(urls):
+    digest = hashlib.sha1()
+    for url in sorted(set(urls)):
+        digest.update(url.encode("utf-8"))
+        digest.update(b"\n")
+
+    return digest.hexdigest()
+
+def load_hub(url):
+    """Returns the cached validators and link list of a hub page, or None if it was never crawled."""
+    try:
+        cached = establish_redis_connection().hgetall(hub_key(url))
+    except Exception as e:
+        print(f"Could not read hub cache for {url}: {e}")
+        return None
+
+    if not cached or "urls" not in cached:
+        return None
+
+    return {
+        "etag": cached.get("etag", ""),
+        "last_modified": cached.get("last_modified", ""),
+        "links_hash": cached.get("links_hash", ""),
+        "urls": json.loads(cached["urls"]),
+        # the depth the hub's children were last crawled with, 0 if they never were
+        "expanded_depth": int(cached.get("expanded_depth", 0)),
+    }
+
+def validator_headers(cached_hub):
+    """Conditional request headers for a hub page that was cached by an earlier run."""
+    headers = {}
+    if cached_hub is None:
+        return headers
+
+    if cached_hub["etag"]:
+        headers["If-None-Match"] = cached_hub["etag"]
+    if cached_hub["last_modified"]:
+        headers["If-Modified-Since"] = cached_hub["last_modified"]
+
+    return headers
+
+def store_hub(url, urls, validators, cached_hub):
+    """
+    Saves the link list of a hub page and returns True if it changed since the cached copy.
+    A hub counts as unchanged when its set of links hashes the same as last time. New links
+    reset the hub to not expanded until mark_expanded is called for it.
+    """
+    if len(urls) == 0:
+        return True
+
+    new_hash = links_hash(urls)
+    changed = cached_hub is None or cached_hub["links_hash"] != new_hash
+
+    try:
+        key = hub_key(url)
+        pipe = establish_redis_connection().pipeline()
+        pipe.hset(key, mapping={
+            "etag": validators.get("etag", ""),
+            "last_modified": validators.get("last_modified", ""),
+            "links_hash": new_hash,
+            "urls": json.dumps(urls),
+            "expanded_depth": 0 if changed else cached_hub["expanded_depth"],
+        })
+        pipe.expire(key, HUB_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not write hub cache for {url}: {e}")
+
+    return changed
+
+def refresh_hub(url):
+    """Keeps an unchanged hub in the cache for another HUB_CACHE_TTL."""
+    try:
+        establish_redis_connection().expire(hub_key(url), HUB_CACHE_TTL)
+    except Exception as e:
+        print(f"Could not refresh hub cache for {url}: {e}")
+
+def should_expand(cached_hub, changed, depth):
+    """
+    An unchanged hub cannot lead to anything new, but only if an earlier run actually crawled
+    its children at least as deep as this one would.
+    """
+    return changed or cached_hub is None or cached_hub["expanded_depth"] < depth
+
+def mark_expanded(hubs):
+    """
+    Records (url, depth) for hubs whose children were all crawled. Called once a crawl has
+    finished, so children lost to a failed run are expanded again next time.
+    """
+    if len(hubs) == 0:
+        return
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        for url, depth in hubs:
+            # a hub that could not be stored ends up without a link list, which load_hub ignores
+            pipe.hset(hub_key(url), "expanded_depth", depth)
+            pipe.expire(hub_key(url), HUB_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not mark {len(hubs)} hubs as expanded: {e}")
@@ -0,0 +1,80 @@
+import os
+from urllib.parse import urlparse
+
+# resource types the crawl and text extraction stages never look at
+BLOCKED_RESOURCE_TYPES = set(filter(None, os.environ.get(
+    "BLOCKED_RESOURCE_TYPES",
+    "image,media,font,stylesheet"
+).split(",")))
+
+# ad and analytics hosts, any subdomain of these is blocked as well
+BLOCKED_HOSTS = set(filter(None, os.environ.get(
+    "BLOCKED_HOSTS",
+    ",".join([
+        "doubleclick.net",
+        "googlesyndication.com",
+        "googleadservices.com",
+        "google-analytics.com",
+        "googletagmanager.com",
+        "googletagservices.com",
+        "adservice.google.com",
+        "amazon-adsystem.com",
+        "adnxs.com",
+        "criteo.com",
+        "taboola.com",
+        "outbrain.com",
+        "scorecardresearch.com",
+        "quantserve.com",
+        "chartbeat.com",
+        "chartbeat.net",
+        "hotjar.com",
+        "facebook.net",
+        "connect.facebook.net",
+        "moatads.com",
+        "pubmatic.com",
+        "rubiconproject.com",
+        "casalemedia.com",
+        "newrelic.com",
+        "nr-data.net",
+    ])
+).split(",")))
+
+def is_blocked_host(hostname):
+    if hostname is None:
+        return False
+
+    labels = hostname.split(".")
+    for i in range(len(labels) - 1):
+        if ".".join(labels[i:]) in BLOCKED_HOSTS:
+            return True
+
+    return False
+
+def should_block(request):
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+
+    return is_blocked_host(urlparse(request.url).hostname)
+
+def block_resources(page):
+    """
+    Aborts every request on the page that the crawl and text extraction stages do not need.
+    Pages that get printed to pdf must not use this, they need the full page.
+    """
+    def handle_route(route):
+        if should_block(route.request):
+            route.abort()
+        else:
+            route.continue_()
+
+    page.route("**/*", handle_route)
+
+async def async_block_resources(page):
+    """Async api version of block_resources."""
+    async def handle_route(route):
+        if should_block(route.request):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", handle_route)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+
+from maizey_api.api_call import MaizeyCallError, MaizeyImproperJson, MaizeyUnavailable, run_concurrently
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from scraper.prompt_builder import estimate_tokens
+
+# batch size shared by every worker, grown while batches go well and halved when they do not.
+# it expires so a size that shrank during an outage does not stick around forever
+SIZE_KEY = "maizey:batch:size"
+SIZE_TTL = 60 * 60
+
+MAIZEY_BATCH_MODE = os.environ.get("MAIZEY_BATCH_MODE", "True") == "True"
+MAIZEY_BATCH_MAX_ITEMS = int(os.environ.get("MAIZEY_BATCH_MAX_ITEMS", 8))
+MAIZEY_BATCH_TOKEN_BUDGET = int(os.environ.get("MAIZEY_BATCH_TOKEN_BUDGET", 8000))
+MAIZEY_BATCH_ITEM_TOKENS = int(os.environ.get("MAIZEY_BATCH_ITEM_TOKENS", 1500))
+MAIZEY_BATCH_TARGET_SECONDS = float(os.environ.get("MAIZEY_BATCH_TARGET_SECONDS", 60))
+# a batch missing more than this fraction of its items counts as a failure
+MAIZEY_BATCH_MAX_MISSING = float(os.environ.get("MAIZEY_BATCH_MAX_MISSING", 0.2))
+
+BATCH_INSTRUCTIONS = (
+    "[batch] Classify every article below on its own, exactly like a single article. "
+    "Reply with one JSON object whose keys are the article numbers and whose values are "
+    "the category arrays for that article, and nothing else."
+)
+
+def trim_to_tokens(text, tokens):
+    return text[:tokens * 4]
+
+def single_prompt(content):
+    return f"[begin] {content} [end]"
+
+def batch_prompt(contents):
+    parts = [BATCH_INSTRUCTIONS]
+    for i, content in enumerate(contents):
+        parts.append(f"[begin {i}] {content} [end {i}]")
+
+    return "\n".join(parts)
+
+def validate_categories(json_response):
+    if type(json_response) is not list:
+        raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
+
+    for category_item in json_response:
+        if type(category_item) is not dict:
+            raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
+
+        if category_item.get("name") is None or category_item.get("confidence") is None:
+            raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
+
+    return json_response
+
+def parse_categories(response):
+    """Parses maizey's reply into a list of {"name", "confidence"} dicts."""
+    return validate_categories(json.loads(response))
+
+def parse_batch_reply(response, item_count):
+    """
+    Returns {position: categories} for the items of a batch reply that are well formed.
+    Anything missing or malformed is left out and classified on its own afterwards.
+    """
+    reply = json.loads(response)
+    if type(reply) is not dict:
+        raise MaizeyImproperJson(f"Error: Maizey batch returned improper json format {reply}")
+
+    parsed = {}
+    for key, categories in reply.items():
+        try:
+            position = int(str(key).strip("[] "))
+            if 0 <= position < item_count:
+                parsed[position] = validate_categories(categories)
+        except (ValueError, MaizeyImproperJson):
+            continue
+
+    return parsed
+
+def current_batch_size():
+    try:
+        size = establish_redis_connection().get(SIZE_KEY)
+    except Exception as e:
+        print(f"Could not read maizey batch size: {e}")
+        size = None
+
+    size = MAIZEY_BATCH_MAX_ITEMS // 2 if size is None else int(size)
+    return min(MAIZEY_BATCH_MAX_ITEMS, max(1, size))
+
+def adapt_batch_size(size, elapsed, missing_ratio, failed):
+    """Additive increase while batches are fast and complete, halves the size otherwise."""
+    if failed or elapsed > MAIZEY_BATCH_TARGET_SECONDS or missing_ratio > MAIZEY_BATCH_MAX_MISSING:
+        new_size = max(1, size // 2)
+    else:
+        new_size = min(MAIZEY_BATCH_MAX_ITEMS, size + 1)
+
+    try:
+        establish_redis_connection().set(SIZE_KEY, new_size, ex=SIZE_TTL)
+    except Exception as e:
+        print(f"Could not store maizey batch size: {e}")
+
+    return new_size
+
+def next_batch(contents, pending, size):
+    """Takes up to size pending items from the front, as long as they fit MAIZEY_BATCH_TOKEN_BUDGET."""
+    batch = []
+    tokens = estimate_tokens(BATCH_INSTRUCTIONS)
+
+    for index in pending:
+        item_tokens = min(estimate_tokens(contents[index]), MAIZEY_BATCH_ITEM_TOKENS)
+        if len(batch) >= size or (len(batch) > 0 and tokens + item_tokens > MAIZEY_BATCH_TOKEN_BUDGET):
+            break
+
+        batch.append(index)
+        tokens += item_tokens
+
+    return batch
+
+def classify_contents(contents, send):
+    """
+    Classifies every content and returns its category list, in order. send(prompt) makes
+    one maizey call and returns the raw reply, it may be called from several threads at once.
+    Contents are packed into multi article prompts when MAIZEY_BATCH_MODE is on, items a batch
+    reply leaves out are sent on their own, concurrently. Items maizey fails on even on their
+    own are None.
+    """
+    results = [None] * len(contents)
+    size = None
+
+    if MAIZEY_BATCH_MODE:
+        pending = list(range(len(contents)))
+        size = current_batch_size()
+
+        while len(pending) > 0:
+            batch = next_batch(contents, pending, size)
+            pending = pending[len(batch):]
+
+            # a batch of one is just a single prompt, the single calls below adapt the size instead
+            if len(batch) == 1:
+                continue
+
+            start = time.monotonic()
+            try:
+                response = send(batch_prompt([trim_to_tokens(contents[index], MAIZEY_BATCH_ITEM_TOKENS) for index in batch]))
+                parsed = parse_batch_reply(response, len(batch))
+                failed = False
+            except MaizeyUnavailable:
+                raise
+            except (MaizeyCallError, MaizeyImproperJson, ValueError) as e:
+                print(f"Maizey batch of {len(batch)} failed, classifying its items one by one: {e}")
+                parsed = {}
+                failed = True
+
+            missing_ratio = 1 - len(parsed) / len(batch)
+            size = adapt_batch_size(size, time.monotonic() - start, missing_ratio, failed)
+            print(f"Maizey batch of {len(batch)} answered {len(parsed)} items, next batch size {size}")
+
+            for position, index in enumerate(batch):
+                results[index] = parsed.get(position)
+
+    # seconds each single call took, to judge whether batching can be tried again
+    elapsed = {}
+
+    def classify_single(index):
+        start = time.monotonic()
+        try:
+            return parse_categories(send(single_prompt(contents[index])))
+        except MaizeyUnavailable:
+            raise
+        except (MaizeyCallError, MaizeyImproperJson, ValueError) as e:
+            print(f"Maizey could not classify item {index}, leaving it for the next run: {e}")
+            return None
+        finally:
+            elapsed[index] = time.monotonic() - start
+
+    missing = [index for index in range(len(contents)) if results[index] is None]
+    replies = run_concurrently(classify_single, missing)
+    for index, categories in zip(missing, replies):
+        results[index] = categories
+
+    # at a size of 1 no batch is sent that could grow it again, so the single calls
+    # stand in for one: if they are fast and answered, the next run probes a batch of 2
+    if size == 1 and len(missing) > 0:
+        unanswered = sum(1 for categories in replies if categories is None)
+        size = adapt_batch_size(size, max(elapsed.values()), unanswered / len(missing), False)
+        print(f"Maizey answered {len(missing) - unanswered} of {len(missing)} single items, next batch size {size}")
+
+    return results
@@ -1,72 +1,157 @@
 import os
-import json
+import random
 
 from celery import shared_task
-from maizey_api.api_call import create_conversation, call_api, MaizeyImproperJson
+from maizey_api.api_call import call_api, MaizeyUnavailable
+from maizey_api.conversation_pool import pooled_conversation, conversations_created
 
 from scraper.retrieval import retrieve_page
+from scraper.seen_index import mark_rejected
+from scraper.snapshots import drop_snapshots
+from scraper.pre_classifier import KeywordModel, REJECT, ACCEPT
+from scraper.prompt_builder import normalize_text, build_prompt_content, record_compression
+from scraper.maizey_batching import classify_contents, single_prompt
+from scraper.classification_cache import config_version, load_classification, store_classification, run_stats
+from scraper.near_duplicates import minhash, find_original, index_document, load_verdict, record_verdict, record_duplicate
 
-# TODO: add feature to disable maizey filtering (for debugging)
-def filter_non_ascii(prompt):
-    initial_size = len(prompt)
-    new_prompt = prompt.encode("ascii", errors="ignore").decode("ascii")
-    new_size = len(new_prompt)
-
-    reduction_size = (initial_size - new_size) / initial_size
-    return (reduction_size, new_prompt)
+# how often a batch waits for an open circuit breaker before it is given up
+MAIZEY_PAUSE_RETRIES = int(os.environ.get("MAIZEY_PAUSE_RETRIES", 6))
 
-@shared_task
-def maizey_filter_content(page, categories_config):
+# TODO: add feature to disable maizey filtering (for debugging)
+@shared_task(bind=True, max_retries=MAIZEY_PAUSE_RETRIES)
+def maizey_filter_content(self, page, categories_config, run_id=None):
     urls, contents = page
 
     project_pk = os.environ.get("MAIZEY_PROJECT_PK")
     api_key = os.environ.get("MAIZEY_API_KEY")
 
     relevant_pages = []
+    rejected_urls = []
+
+    version = config_version(categories_config)
+    # every message borrows a conversation from the pool shared by all tasks, so threads
+    # sending at the same time never share one and a new one is only created when none is idle
+    def send(prompt):
+        with pooled_conversation(project_pk, api_key, run_id) as conversation_pk:
+            return call_api(project_pk, conversation_pk, api_key, prompt)
+
+    # clear rejects (and clear hits, if enabled) are decided locally, the rest goes to maizey
+    routes = KeywordModel(categories_config).route(contents)
+    local_rejects = 0
+    local_accepts = 0
 
     try:
-        conversation_pk = create_conversation(project_pk, api_key)
-        for url, content in zip(urls, contents):
-            reduction, content = filter_non_ascii(content)
+        # (url, content, categories) of every page that has to be judged by its categories
+        classified = []
+        # pages that are not cached yet, sent to maizey together afterwards
+        pending = []
+
+        for url, content, (route, local_category) in zip(urls, contents, routes):
+            signature = minhash(content)
+            if signature is not None:
+                original = find_original(url, signature)
+                index_document(url, signature)
+
+                # syndicated copies get the verdict of the first copy that was classified
+                if original is not None:
+                    found, category = load_verdict(original)
+                    if found:
+                        record_duplicate(url, original, category in categories_config)
+                        record_verdict(url, category)
+                        if category in categories_config:
+                            relevant_pages.append((url, (category, categories_config[category]["folder"]), content))
+                        else:
+                            rejected_urls.append(url)
+                        continue
+
+            if route == REJECT:
+                local_rejects += 1
+                record_verdict(url, None)
+                rejected_urls.append(url)
+                continue
+
+            if route == ACCEPT:
+                local_accepts += 1
+                record_verdict(url, local_category)
+                relevant_pages.append((url, (local_category, categories_config[local_category]["folder"]), content))
+                continue
+
+            reduction, content = normalize_text(content)
 
-            # if content contains too many non-ASCII characters
+            # if content is mostly unprintable characters, usually a pdf that did not extract
             if reduction > 0.3:
                 continue
 
-            content = f"[begin] {content} [end]"
-            response = call_api(project_pk, conversation_pk, api_key, content)
+            # only the title, lede and most telling sentences of long articles are sent
+            content, compression = build_prompt_content(content)
+            record_compression(run_id, url, compression)
 
-            json_response = json.loads(response)
+            # identical content was classified before under the same categories
+            json_response = load_classification(single_prompt(content), version, run_id)
+            if json_response is None:
+                pending.append((url, content))
+            else:
+                classified.append((url, single_prompt(content), json_response))
 
-            if type(json_response) is not list:
-                raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
+        if len(pending) > 0:
+            responses = classify_contents([content for _, content in pending], send)
+            for (url, content), json_response in zip(pending, responses):
+                # not cached, judged nor rejected, so the page is classified again next run
+                if json_response is None:
+                    continue
 
+                store_classification(single_prompt(content), version, json_response)
+                classified.append((url, single_prompt(content), json_response))
+
+        for url, content, json_response in classified:
             highest_score = 0
             best_category = ""
             for category_item in json_response:
-                if type(category_item) is not dict:
-                    raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
-
-                if category_item.get("name") is None or category_item.get("confidence") is None:
-                    raise MaizeyImproperJson(f"Error: Maizey filter returned improper json format {json_response}")
-
                 if category_item["confidence"] > highest_score:
                     highest_score = category_item["confidence"]
                     best_category = category_item["name"]
 
             # if best category is not in the list of categories
             if best_category not in categories_config:
+                record_verdict(url, None)
+                rejected_urls.append(url)
                 continue
 
             # if all the category scores are too low
             if highest_score < categories_config[best_category]["min_relevance_threshold"]:
+                record_verdict(url, None)
+                rejected_urls.append(url)
                 continue
 
+            record_verdict(url, best_category)
+
             # append the page
             relevant_pages.append((url, (best_category, categories_config[best_category]["folder"]), content))
 
+        mark_rejected(rejected_urls)
+        # only relevant pages are printed, the snapshots of everything else are not needed
+        drop_snapshots(set(urls) - {url for url, _, _ in relevant_pages})
         return relevant_pages
 
+    except MaizeyUnavailable as e:
+        # the whole batch waits for maizey to recover instead of failing page by page
+        if self.request.retries >= self.max_retries:
+            print(f"Maizey stayed unavailable, giving up on {len(urls)} pages")
+            drop_snapshots(urls)
+            return []
+
+        print(e)
+        raise self.retry(exc=e, countdown=e.retry_in + random.uniform(0, 30))
+
     except Exception as e:
         print(e)
+        mark_rejected(rejected_urls)
+        drop_snapshots(urls)
         return []
+
+    finally:
+        print(f"Pre-classifier: {local_rejects} rejected and {local_accepts} accepted locally out of {len(urls)} pages")
+        if run_id is not None:
+            hits, misses = run_stats(run_id)
+            print(f"Classification cache: {hits} hits, {misses} misses this run")
+            print(f"Maizey conversations created this run: {conversations_created(run_id)}")
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import zlib
+import time
+import hashlib
+
+import numpy as np
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import canonicalize_url
+
+# duplicates of accepted or archived copies, scored by when they were recorded. entries older
+# than NEAR_DUPLICATE_TTL are pruned, the set itself never expires
+ACCEPTED_DUPLICATES_KEY = "dup:accepted"
+
+# 16 bands of 8 rows puts the lsh threshold near a jaccard similarity of 0.7,
+# candidates are then checked against NEAR_DUPLICATE_THRESHOLD on the full signature
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 5
+
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", 0.8))
+NEAR_DUPLICATE_TTL = int(os.environ.get("NEAR_DUPLICATE_TTL", 60 * 60 * 24 * 30))
+
+# a prime just above 2^32, hashes are crc32 so every permutation stays inside uint64
+HASH_PRIME = np.uint64(4294967311)
+
+# fixed seed, signatures have to be comparable across workers and runs
+_rng = np.random.default_rng(20240501)
+PERMUTATION_A = _rng.integers(1, 2 ** 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _rng.integers(0, 2 ** 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def band_key(band, band_hash):
+    return f"dup:band:{band}:{band_hash}"
+
+def signature_key(url):
+    return f"dup:sig:{url}"
+
+def verdict_key(url):
+    return f"dup:verdict:{url}"
+
+def duplicate_key(url):
+    # duplicate url -> url of the copy it duplicates
+    return f"dup:of:{url}"
+
+def shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if len(words) > 0 else set()
+
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    """Returns the MinHash signature of a text as a uint64 array, None for a text without words."""
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)], dtype=np.uint64)
+    if len(hashes) == 0:
+        return None
+
+    # one row per permutation, min over the shingles
+    permuted = (np.outer(PERMUTATION_A, hashes) + PERMUTATION_B[:, None]) % HASH_PRIME
+    return permuted.min(axis=1)
+
+def band_hashes(signature):
+    rows = signature.reshape(LSH_BANDS, LSH_ROWS)
+    return [hashlib.sha1(row.tobytes()).hexdigest()[:16] for row in rows]
+
+def encode_signature(signature):
+    return signature.astype(">u8").tobytes().hex()
+
+def decode_signature(value):
+    return np.frombuffer(bytes.fromhex(value), dtype=">u8").astype(np.uint64)
+
+def load_signature(url):
+    try:
+        value = establish_redis_connection().get(signature_key(canonicalize_url(url)))
+    except Exception as e:
+        print(f"Could not read signature of {url}: {e}")
+        return None
+
+    return None if value is None else decode_signature(value)
+
+def find_original(url, signature):
+    """
+    Returns the url of the indexed copy that url's text nearly duplicates, or None. Copies that
+    are duplicates themselves are followed back to the copy they duplicate.
+    """
+    url = canonicalize_url(url)
+
+    try:
+        redis_conn = establish_redis_connection()
+        pipe = redis_conn.pipeline()
+        for band, band_hash in enumerate(band_hashes(signature)):
+            pipe.smembers(band_key(band, band_hash))
+        candidates = set().union(*pipe.execute()) - {url}
+        if len(candidates) == 0:
+            return None
+
+        candidates = list(candidates)
+        signatures = redis_conn.mget([signature_key(candidate) for candidate in candidates])
+    except Exception as e:
+        print(f"Could not look up near duplicates of {url}: {e}")
+        return None
+
+    best = None
+    best_similarity = NEAR_DUPLICATE_THRESHOLD
+    for candidate, value in zip(candidates, signatures):
+        if value is None:
+            continue
+
+        similarity = float(np.mean(decode_signature(value) == signature))
+        if similarity >= best_similarity:
+            best = candidate
+            best_similarity = similarity
+
+    if best is None:
+        return None
+
+    try:
+        return redis_conn.get(duplicate_key(best)) or best
+    except Exception:
+        return best
+
+def index_document(url, signature):
+    url = canonicalize_url(url)
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.set(signature_key(url), encode_signature(signature), ex=NEAR_DUPLICATE_TTL)
+        for band, band_hash in enumerate(band_hashes(signature)):
+            key = band_key(band, band_hash)
+            pipe.sadd(key, url)
+            pipe.expire(key, NEAR_DUPLICATE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not index {url} for near duplicates: {e}")
+
+def record_verdict(url, category):
+    """Remembers what classification decided for url, category None meaning it was rejected."""
+    try:
+        establish_redis_connection().set(verdict_key(canonicalize_url(url)), json.dumps(category), ex=NEAR_DUPLICATE_TTL)
+    except Exception as e:
+        print(f"Could not record verdict of {url}: {e}")
+
+def load_verdict(url):
+    """Returns (found, category) for a url classified before, category None meaning it was rejected."""
+    try:
+        value = establish_redis_connection().get(verdict_key(canonicalize_url(url)))
+    except Exception as e:
+        print(f"Could not read verdict of {url}: {e}")
+        return (False, None)
+
+    if value is None:
+        return (False, None)
+
+    return (True, json.loads(value))
+
+def record_duplicate(url, original, accepted):
+    """
+    Remembers that url duplicates original. Only duplicates of accepted or archived copies are
+    added to ACCEPTED_DUPLICATES_KEY, which the seen index is built from.
+    """
+    url = canonicalize_url(url)
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.set(duplicate_key(url), original, ex=NEAR_DUPLICATE_TTL)
+        if accepted:
+            pipe.zadd(ACCEPTED_DUPLICATES_KEY, {url: time.time()})
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not record {url} as a duplicate of {original}: {e}")
+
+    print(f"{url} is a near duplicate of {original}")
+
+def accepted_duplicates():
+    """Returns the duplicates of accepted or archived copies recorded within NEAR_DUPLICATE_TTL."""
+    redis_conn = establish_redis_connection()
+    redis_conn.zremrangebyscore(ACCEPTED_DUPLICATES_KEY, 0, time.time() - NEAR_DUPLICATE_TTL)
+    return redis_conn.zrange(ACCEPTED_DUPLICATES_KEY, 0, -1)
@@ -1,15 +1,30 @@
+import os
+import time
 import urllib3
 import pdfplumber
 from io import BytesIO
 
 from celery import shared_task
 
-@shared_task
-def scrape_pdf_text(url):
+from scraper.politeness import acquire, report_status
+from scraper.robots import is_allowed
+from scraper.batch_planner import record_batch_time
+
+PDF_FETCH_TIMEOUT = float(os.environ.get("PDF_FETCH_TIMEOUT", 30))
+
+def download_pdf_text(http, url):
+    """Returns the text of the pdf at url, None if it was not fetched."""
     all_text = ""
-    http = urllib3.PoolManager()
     temp = BytesIO()
-    temp.write(http.request("GET", url).data)
+    if not is_allowed(url) or not acquire(url):
+        return None
+
+    response = http.request("GET", url, timeout=PDF_FETCH_TIMEOUT)
+    report_status(url, response.status, response.headers.get("Retry-After"))
+    if response.status // 100 != 2:
+        return None
+
+    temp.write(response.data)
 
     try:    # to verify is the url has valid pdf file!
         pdf = pdfplumber.open(temp)
@@ -22,4 +37,28 @@ def scrape_pdf_text(url):
     except:
         pass
 
-    return ([url], [all_text])
+    return all_text
+
+@shared_task
+def scrape_pdf_text(urls):
+    start = time.monotonic()
+    http = urllib3.PoolManager()
+
+    # pdfs that were not fetched are left out, they would only be rejected for being empty
+    fetched_urls = []
+    texts = []
+    for url in urls:
+        try:
+            text = download_pdf_text(http, url)
+        except Exception as e:
+            print(f"Could not download pdf {url}: {e}")
+            continue
+
+        if text is None:
+            continue
+
+        fetched_urls.append(url)
+        texts.append(text)
+
+    record_batch_time("pdf", len(urls), time.monotonic() - start)
+    return (fetched_urls, texts)
@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import registrable_domain
+from scraper.robots import crawl_delay
+
+# default pace for a host that does not ask for anything else
+POLITENESS_RATE = float(os.environ.get("POLITENESS_RATE", 2.0))
+POLITENESS_BURST = float(os.environ.get("POLITENESS_BURST", 4.0))
+# a fetch waits at most this long for a token before the url is skipped
+POLITENESS_MAX_WAIT = float(os.environ.get("POLITENESS_MAX_WAIT", 60))
+# backoff used when a host answers 429/503 without a Retry-After header
+POLITENESS_DEFAULT_BACKOFF = float(os.environ.get("POLITENESS_DEFAULT_BACKOFF", 30))
+
+THROTTLE_STATUSES = (429, 503)
+
+# returns how many ms the caller has to wait, 0 means a token was taken
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+
+local blocked_for = redis.call('PTTL', KEYS[2])
+if blocked_for > 0 then
+    return blocked_for
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 60000)
+return wait
+"""
+
+_token_bucket = None
+
+def token_bucket():
+    global _token_bucket
+
+    if _token_bucket is None:
+        _token_bucket = establish_redis_connection().register_script(TOKEN_BUCKET_SCRIPT)
+
+    return _token_bucket
+
+def bucket_key(domain):
+    return f"polite:{domain}:bucket"
+
+def blocked_key(domain):
+    return f"polite:{domain}:blocked"
+
+def host_rate(url):
+    """Returns the (rate, burst) allowed for the url's host, honouring its robots.txt Crawl-delay."""
+    delay = crawl_delay(url)
+    if delay > 0:
+        return (min(POLITENESS_RATE, 1 / delay), 1)
+
+    return (POLITENESS_RATE, POLITENESS_BURST)
+
+def request_token(url):
+    """Tries to take a token for the url's host and returns how many seconds to wait before retrying."""
+    domain = registrable_domain(urlparse(url).netloc)
+    rate, burst = host_rate(url)
+
+    wait_ms = token_bucket()(keys=[bucket_key(domain), blocked_key(domain)], args=[rate, burst])
+    return int(wait_ms) / 1000
+
+def acquire(url):
+    """
+    Blocks until the url's host may be fetched again and returns True, or False if that
+    would take longer than POLITENESS_MAX_WAIT. Fetches go ahead if redis is unreachable.
+    """
+    waited = 0.0
+    while True:
+        try:
+            wait = request_token(url)
+        except Exception as e:
+            print(f"Rate limiter unavailable, fetching {url} anyway: {e}")
+            return True
+
+        if wait <= 0:
+            return True
+
+        if waited + wait > POLITENESS_MAX_WAIT:
+            print(f"Skipping {url}, host is rate limited for another {wait:.1f}s")
+            return False
+
+        time.sleep(wait)
+        waited += wait
+
+async def async_acquire(url):
+    """Async version of acquire, sleeps without blocking the event loop."""
+    waited = 0.0
+    while True:
+        try:
+            # the first token request of a host may have to fetch its robots.txt
+            wait = await asyncio.to_thread(request_token, url)
+        except Exception as e:
+            print(f"Rate limiter unavailable, fetching {url} anyway: {e}")
+            return True
+
+        if wait <= 0:
+            return True
+
+        if waited + wait > POLITENESS_MAX_WAIT:
+            print(f"Skipping {url}, host is rate limited for another {wait:.1f}s")
+            return False
+
+        await asyncio.sleep(wait)
+        waited += wait
+
+def parse_retry_after(value):
+    if value is None or value.strip() == "":
+        return POLITENESS_DEFAULT_BACKOFF
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return POLITENESS_DEFAULT_BACKOFF
+
+def report_status(url, status, retry_after=None):
+    """
+    Pauses the url's host for every worker when it answers with a throttling status.
+    Returns True if the status was a throttle.
+    """
+    if status not in THROTTLE_STATUSES:
+        return False
+
+    backoff = parse_retry_after(retry_after)
+    domain = registrable_domain(urlparse(url).netloc)
+    print(f"{domain} answered {status}, backing off for {backoff:.0f}s")
+
+    try:
+        # the key expiring is what unblocks the host, so no clocks have to agree
+        establish_redis_connection().set(blocked_key(domain), 1, px=max(1, int(backoff * 1000)))
+    except Exception as e:
+        print(f"Could not record backoff for {domain}: {e}")
+
+    return True
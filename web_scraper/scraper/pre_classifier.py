@@ -0,0 +1,106 @@
+import os
+import re
+import math
+
+import numpy as np
+
+# a page scoring below this fraction of every category's min_relevance_threshold never reaches maizey
+PRECLASSIFIER_REJECT_RATIO = float(os.environ.get("PRECLASSIFIER_REJECT_RATIO", 0.2))
+# pages at or above this relevance are accepted without maizey, empty disables local accepts
+PRECLASSIFIER_ACCEPT_SCORE = os.environ.get("PRECLASSIFIER_ACCEPT_SCORE", "")
+# weighted keyword hits at which relevance reaches 1 - 1/e
+PRECLASSIFIER_SATURATION = float(os.environ.get("PRECLASSIFIER_SATURATION", 10))
+
+WORD_PATTERN = re.compile(r"\w+(?:-\w+)*")
+
+REJECT = "reject"
+ACCEPT = "accept"
+MAIZEY = "maizey"
+
+def tokenize(text):
+    return WORD_PATTERN.findall(text.lower())
+
+class KeywordModel:
+    """
+    Scores pages against the keywords of every category in categories_config.json. Each
+    category is a centroid over the shared keyword vocabulary, weighted by how specific a
+    keyword is to it (idf over the categories), and a page is its sublinear keyword counts.
+    """
+
+    def __init__(self, categories_config):
+        # categories that can never pass their threshold are not worth scoring
+        self.categories = [
+            name for name, config in categories_config.items()
+            if config["min_relevance_threshold"] <= 1
+        ]
+        self.thresholds = np.array([categories_config[name]["min_relevance_threshold"] for name in self.categories])
+
+        # without keywords for every category a low score proves nothing
+        self.complete = len(self.categories) > 0 and all(
+            len(categories_config[name].get("keywords", [])) > 0 for name in self.categories
+        )
+
+        keywords = [
+            set(" ".join(tokenize(keyword)) for keyword in categories_config[name].get("keywords", []))
+            for name in self.categories
+        ]
+        vocabulary = sorted(set().union(*keywords)) if len(keywords) > 0 else []
+        self.index = {term: i for i, term in enumerate(vocabulary)}
+        self.max_ngram = max([len(term.split()) for term in vocabulary], default=1)
+
+        self.centroids = np.zeros((len(self.categories), len(vocabulary)))
+        for row, category_keywords in enumerate(keywords):
+            for term in category_keywords:
+                self.centroids[row, self.index[term]] = 1
+
+        document_frequency = self.centroids.sum(axis=0)
+        if len(vocabulary) > 0:
+            self.centroids *= np.log(1 + len(self.categories) / np.maximum(document_frequency, 1))
+
+    def term_counts(self, text):
+        counts = np.zeros(len(self.index))
+        tokens = tokenize(text)
+
+        for n in range(1, self.max_ngram + 1):
+            for i in range(len(tokens) - n + 1):
+                term = tokens[i] if n == 1 else " ".join(tokens[i:i + n])
+                position = self.index.get(term)
+                if position is not None:
+                    counts[position] += 1
+
+        return counts
+
+    def relevance(self, contents):
+        """Returns a (pages, categories) array of relevance in [0, 1)."""
+        if len(contents) == 0 or len(self.index) == 0:
+            return np.zeros((len(contents), len(self.categories)))
+
+        counts = np.stack([self.term_counts(content) for content in contents])
+        weights = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0)
+
+        return 1 - np.exp(-(weights @ self.centroids.T) / PRECLASSIFIER_SATURATION)
+
+    def route(self, contents):
+        """
+        Decides for every page whether maizey has to see it. Returns one (decision, category)
+        per page, decision being REJECT, ACCEPT (with the category) or MAIZEY.
+        """
+        if not self.complete:
+            return [(MAIZEY, None)] * len(contents)
+
+        relevance = self.relevance(contents)
+        accept_score = float(PRECLASSIFIER_ACCEPT_SCORE) if PRECLASSIFIER_ACCEPT_SCORE != "" else math.inf
+
+        routes = []
+        for scores in relevance:
+            if np.all(scores < self.thresholds * PRECLASSIFIER_REJECT_RATIO):
+                routes.append((REJECT, None))
+                continue
+
+            best = int(np.argmax(scores))
+            if scores[best] >= max(accept_score, self.thresholds[best]):
+                routes.append((ACCEPT, self.categories[best]))
+            else:
+                routes.append((MAIZEY, None))
+
+        return routes
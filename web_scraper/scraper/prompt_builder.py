@@ -0,0 +1,125 @@
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+
+from shared.core_lib.redis_utils import establish_redis_connection
+
+MAIZEY_PROMPT_TOKEN_BUDGET = int(os.environ.get("MAIZEY_PROMPT_TOKEN_BUDGET", 1500))
+MAIZEY_PROMPT_LEDE_TOKENS = int(os.environ.get("MAIZEY_PROMPT_LEDE_TOKENS", 200))
+PROMPT_STATS_TTL = int(os.environ.get("PROMPT_STATS_TTL", 60 * 60 * 24 * 7))
+
+# control, formatting and private use characters and the replacement character, which is
+# what garbled pdf text is made of. everything else, accents and curly quotes included, stays
+DROPPED_CHARACTERS = re.compile(
+    r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\u00ad\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff\ufffd\ue000-\uf8ff]"
+)
+# runs of whitespace other than newlines, which separate paragraphs
+SPACE_RUNS = re.compile(r"[^\S\n]+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = set("""
+a about after all also an and any are as at be been but by can could did do does for from had
+has have he her his i if in into is it its more most my no not of on or our out over said she so
+than that the their them then there these they this to up was we were what when which who will
+with would you your
+""".split())
+
+def estimate_tokens(text):
+    # roughly 4 characters per token for english text
+    return len(text) // 4 + 1
+
+def normalize_text(text):
+    """
+    Returns (dropped fraction, text) with the text NFKC normalized, unprintable characters
+    removed and runs of spaces collapsed. Unlike stripping everything outside ascii, names,
+    accents and punctuation of non english text survive.
+    """
+    if len(text) == 0:
+        return (0, text)
+
+    text = unicodedata.normalize("NFKC", text)
+    cleaned, dropped = DROPPED_CHARACTERS.subn("", text)
+
+    return (dropped / len(text), SPACE_RUNS.sub(" ", cleaned).strip())
+
+def split_article(content):
+    """Splits content as built by the filter stage (title, blank line, paragraphs) into (title, paragraphs)."""
+    title, separator, body = content.partition("\n\n")
+    if separator == "" or "\n" in title or estimate_tokens(title) > 100:
+        title, body = "", content
+
+    paragraphs = [paragraph.strip() for paragraph in body.split("\n") if paragraph.strip() != ""]
+    return (title.strip(), paragraphs)
+
+def score_sentences(sentences):
+    """Scores sentences by how frequent their words are in the whole article, normalized for length."""
+    words = [[word for word in WORD_PATTERN.findall(sentence.lower()) if word not in STOPWORDS] for sentence in sentences]
+    frequencies = Counter(word for sentence_words in words for word in sentence_words)
+
+    scores = []
+    for sentence_words in words:
+        if len(sentence_words) == 0:
+            scores.append(0)
+            continue
+        scores.append(sum(frequencies[word] for word in sentence_words) / math.sqrt(len(sentence_words)))
+
+    return scores
+
+def build_prompt_content(content, budget=MAIZEY_PROMPT_TOKEN_BUDGET):
+    """
+    Shrinks an article to about budget tokens, keeping what says the most about its topic:
+    the title, the lede and the best scoring of the remaining sentences, in their original
+    order. Returns (content, compression ratio), the ratio being kept tokens over original tokens.
+    """
+    original_tokens = estimate_tokens(content)
+    if original_tokens <= budget:
+        return (content, 1.0)
+
+    title, paragraphs = split_article(content)
+
+    lede = []
+    lede_tokens = 0
+    while len(paragraphs) > 0 and lede_tokens < MAIZEY_PROMPT_LEDE_TOKENS:
+        paragraph = paragraphs.pop(0)
+        lede.append(paragraph)
+        lede_tokens += estimate_tokens(paragraph)
+
+    remaining = budget - estimate_tokens(title) - lede_tokens
+    sentences = [sentence for paragraph in paragraphs for sentence in SENTENCE_END.split(paragraph) if sentence != ""]
+    scores = score_sentences(sentences)
+
+    kept = set()
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        tokens = estimate_tokens(sentences[i])
+        if tokens > remaining:
+            continue
+        kept.add(i)
+        remaining -= tokens
+
+    parts = [title] if title != "" else []
+    parts.append("\n".join(lede))
+    parts.append(" ".join(sentences[i] for i in sorted(kept)))
+    built = "\n\n".join(part for part in parts if part != "")
+
+    # a lede longer than the budget is cut like any other text
+    built = built[:budget * 4]
+
+    return (built, estimate_tokens(built) / original_tokens)
+
+def stats_key(run_id):
+    return f"maizey:prompt:ratio:{run_id}"
+
+def record_compression(run_id, url, ratio):
+    if run_id is None:
+        return
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.hset(stats_key(run_id), url, round(ratio, 3))
+        pipe.expire(stats_key(run_id), PROMPT_STATS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not record prompt compression of {url}: {e}")
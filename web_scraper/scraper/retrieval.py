@@ -1,15 +1,56 @@
 from celery import shared_task
-from playwright.sync_api import sync_playwright
 import requests
 import uuid
 
 from gdrive.api import GoogleDriveService
 from shared.core_lib.db_utils import establish_connection, insert_articles
+from scraper.seen_index import mark_seen, is_seen
+from scraper.near_duplicates import minhash, load_signature, find_original, record_duplicate
+from scraper.politeness import acquire, report_status
+from scraper.robots import is_allowed
+from scraper.browser_session import browser_session
+from scraper.snapshots import load_snapshot, drop_snapshot, SNAPSHOT_RENDER_TIMEOUT
+from scraper.pdf_scraper import PDF_FETCH_TIMEOUT
+
+def goto_politely(page, url, wait_until):
+    if not is_allowed(url) or not acquire(url):
+        return False
+
+    response = page.goto(url, wait_until=wait_until)
+    if response is not None and report_status(url, response.status, response.headers.get("retry-after")):
+        return False
+
+    return True
+
+def install_snapshot_as_pdf(page, url, path):
+    """Prints the snapshot taken by the filter stage, returns False if there is none to print."""
+    html = load_snapshot(url)
+    if html is None:
+        return False
+
+    try:
+        # only images and stylesheets are requested, the page itself is not loaded again
+        page.set_content(html, wait_until="domcontentloaded", timeout=SNAPSHOT_RENDER_TIMEOUT)
+        try:
+            page.wait_for_load_state("load", timeout=SNAPSHOT_RENDER_TIMEOUT)
+        except Exception as e:
+            # the text is all there, a missing image is no reason to load the whole page again
+            print(f"Printing snapshot of {url} before every resource loaded: {e}")
+        page.pdf(path=path)
+
+        return True
+    except Exception as e:
+        print(f"Could not print snapshot of {url}, loading the page instead: {e}")
+        return False
 
 def install_page_as_pdf(page, url, path, timeout_time, max_retry):
+    if install_snapshot_as_pdf(page, url, path):
+        return True
+
     for _ in range(max_retry):
         try:
-            page.goto(url, wait_until="networkidle")
+            if not goto_politely(page, url, "networkidle"):
+                return False
             page.pdf(path=path)
 
             return True
@@ -20,45 +61,55 @@ def install_page_as_pdf(page, url, path, timeout_time, max_retry):
             continue
 
     try:
-        page.goto(url, wait_until="load")
+        if not goto_politely(page, url, "load"):
+            return False
         page.pdf(path=path)
 
         return True
-    except:
+    except Exception as e:
         print(f"{e}")
         return False
 
 @shared_task
 def retrieve_page(pages_batch, browser):
-    with sync_playwright() as p:
-        browser = p.chromium.connect_over_cdp(browser)
-        page = browser.new_page()
+    gdrive = GoogleDriveService()
+    conn, cur = establish_connection()
 
-        gdrive = GoogleDriveService()
-        conn, cur = establish_connection()
+    for url, category, content in pages_batch:
+        # a near duplicate of an article that is already archived is not uploaded again
+        signature = load_signature(url)
+        if signature is None:
+            signature = minhash(content)
+        original = None if signature is None else find_original(url, signature)
+        if original is not None and is_seen(original):
+            record_duplicate(url, original, True)
+            drop_snapshot(url)
+            continue
 
-        for url, category, _ in pages_batch:
-            category_name, category_folder = category
-            hyphened_category_name = category_name.replace(" ", "-")
+        category_name, category_folder = category
+        hyphened_category_name = category_name.replace(" ", "-")
 
-            file_id = uuid.uuid4()
-            install_filename = str(file_id).replace("-", "_")
+        file_id = uuid.uuid4()
+        install_filename = str(file_id).replace("-", "_")
 
-            if not install_page_as_pdf(page, url, f"/app/pages/{hyphened_category_name}-{install_filename}.pdf", 5000, 2):
-                print("FAILED TO INSTALL PAGE!")
-                continue
+        # pdfs need the full page, so this page does not block any resources
+        with browser_session.page(browser) as page:
+            installed = install_page_as_pdf(page, url, f"/app/pages/{hyphened_category_name}-{install_filename}.pdf", 5000, 2)
 
-            drive_file_id = gdrive.upload_file(category_folder, f"{install_filename}.pdf", f"/app/pages/{hyphened_category_name}-{install_filename}.pdf")
+        if not installed:
+            print("FAILED TO INSTALL PAGE!")
+            continue
 
-            insert_articles(conn, cur, file_id, drive_file_id, url)
+        drive_file_id = gdrive.upload_file(category_folder, f"{install_filename}.pdf", f"/app/pages/{hyphened_category_name}-{install_filename}.pdf")
 
-            print(f"INSTALLED {url} => {install_filename}.pdf")
+        insert_articles(conn, cur, file_id, drive_file_id, url)
+        mark_seen(url)
+        drop_snapshot(url)
 
-        cur.close()
-        conn.close()
+        print(f"INSTALLED {url} => {install_filename}.pdf")
 
-        page.close()
-        browser.close()
+    cur.close()
+    conn.close()
 
     return len(pages_batch)
 
@@ -66,29 +117,44 @@ def retrieve_page(pages_batch, browser):
 def retrieve_pdf(pages):
     if len(pages) == 0:
         return
-    print("FETCHING")
-    url, category, content = pages[0]
-    category_name, category_folder = category
 
-    response = requests.get(url)
-    status = response.status_code
-    if status // 100 != 2:
-        print(f"ERROR retrieving pdf from {url}")
-        return None
+    gdrive = GoogleDriveService()
+    conn, cur = establish_connection()
 
-    file_id = uuid.uuid4()
-    install_filename = str(file_id).replace("-", "_")
-    hyphened_category_name = category_name.replace(" ", "-")
+    for url, category, content in pages:
+        print("FETCHING")
+        category_name, category_folder = category
 
-    with open(f"/app/pages/{hyphened_category_name}-{install_filename}.pdf", "wb") as f:
-        f.write(response.content)
+        if not is_allowed(url) or not acquire(url):
+            continue
 
-    gdrive = GoogleDriveService()
-    drive_file_id = gdrive.upload_file(category_folder, f"{install_filename}.pdf", f"/app/pages/{hyphened_category_name}-{install_filename}.pdf")
+        # one pdf failing to download, upload or insert does not take the rest of the batch down
+        try:
+            response = requests.get(url, timeout=PDF_FETCH_TIMEOUT)
+            report_status(url, response.status_code, response.headers.get("Retry-After"))
+            status = response.status_code
+            if status // 100 != 2:
+                print(f"ERROR retrieving pdf from {url}")
+                continue
+
+            file_id = uuid.uuid4()
+            install_filename = str(file_id).replace("-", "_")
+            hyphened_category_name = category_name.replace(" ", "-")
+
+            with open(f"/app/pages/{hyphened_category_name}-{install_filename}.pdf", "wb") as f:
+                f.write(response.content)
+
+            drive_file_id = gdrive.upload_file(category_folder, f"{install_filename}.pdf", f"/app/pages/{hyphened_category_name}-{install_filename}.pdf")
+
+            insert_articles(conn, cur, file_id, drive_file_id, url)
+            mark_seen(url)
+        except Exception as e:
+            print(f"ERROR installing pdf from {url}: {e}")
+            # a failed insert leaves the transaction aborted for the following pdfs
+            conn.rollback()
+            continue
+
+        print("PDF successfully written")
 
-    conn, cur = establish_connection()
-    insert_articles(conn, cur, file_id, drive_file_id, url)
     cur.close()
     conn.close()
-
-    print("PDF successfully written")
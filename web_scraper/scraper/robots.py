@@ -0,0 +1,94 @@
+import os
+import time
+from urllib.parse import urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from shared.core_lib.redis_utils import establish_redis_connection
+
+ROBOTS_TTL = int(os.environ.get("ROBOTS_TTL", 60 * 60 * 24))
+# robots.txt that could not be fetched (timeouts, 5xx) is retried much sooner
+ROBOTS_ERROR_TTL = int(os.environ.get("ROBOTS_ERROR_TTL", 60 * 15))
+ROBOTS_USER_AGENT = os.environ.get("ROBOTS_USER_AGENT", "*")
+ROBOTS_FETCH_TIMEOUT = float(os.environ.get("ROBOTS_FETCH_TIMEOUT", 10))
+
+# host -> (parser, expires_at), so a host's rules are parsed once per process and ttl
+_parsers = {}
+
+def robots_key(netloc):
+    return f"robots:{netloc}"
+
+def fetch_robots(netloc):
+    """Downloads robots.txt of a host. Returns (text, ttl), an empty text allows everything."""
+    robots_url = urlunparse(("https", netloc, "/robots.txt", '', '', ''))
+
+    try:
+        response = requests.get(robots_url, timeout=ROBOTS_FETCH_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Could not fetch robots.txt of {netloc}: {e}")
+        return ("", ROBOTS_ERROR_TTL)
+
+    if response.status_code // 100 == 2:
+        return (response.text, ROBOTS_TTL)
+
+    # a missing robots.txt means everything is allowed
+    if response.status_code // 100 == 4:
+        return ("", ROBOTS_TTL)
+
+    return ("", ROBOTS_ERROR_TTL)
+
+def load_rules(netloc):
+    """Returns the parsed robots.txt of a host from memory, redis, or the host itself."""
+    cached = _parsers.get(netloc)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    text = None
+    ttl = ROBOTS_TTL
+    try:
+        redis_conn = establish_redis_connection()
+        text = redis_conn.get(robots_key(netloc))
+        if text is not None:
+            ttl = max(1, redis_conn.ttl(robots_key(netloc)))
+    except Exception as e:
+        print(f"Could not read cached robots.txt of {netloc}: {e}")
+
+    if text is None:
+        text, ttl = fetch_robots(netloc)
+        try:
+            establish_redis_connection().set(robots_key(netloc), text, ex=ttl)
+        except Exception as e:
+            print(f"Could not cache robots.txt of {netloc}: {e}")
+
+    parser = RobotFileParser()
+    parser.parse(text.splitlines())
+    _parsers[netloc] = (parser, time.monotonic() + ttl)
+
+    return parser
+
+def is_allowed(url):
+    parsed = urlparse(url)
+    if parsed.netloc == "":
+        return True
+
+    return load_rules(parsed.netloc).can_fetch(ROBOTS_USER_AGENT, url)
+
+def filter_allowed(urls):
+    return [url for url in urls if is_allowed(url)]
+
+def crawl_delay(url):
+    """Returns the Crawl-delay (seconds) the url's host asks for, 0 if it does not ask for one."""
+    parsed = urlparse(url)
+    if parsed.netloc == "":
+        return 0.0
+
+    parser = load_rules(parsed.netloc)
+    delay = parser.crawl_delay(ROBOTS_USER_AGENT)
+    if delay is None:
+        rate = parser.request_rate(ROBOTS_USER_AGENT)
+        if rate is not None and rate.requests > 0:
+            return rate.seconds / rate.requests
+        return 0.0
+
+    return float(delay)
@@ -0,0 +1,117 @@
+import os
+import time
+
+from shared.core_lib.db_utils import establish_connection
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import canonicalize_url, unique_urls
+from scraper.near_duplicates import accepted_duplicates
+
+SEEN_KEY = "urls:seen"
+REJECTED_KEY = "urls:rejected"
+
+# rejected pages get another chance after this long, pages do get rewritten
+REJECTED_TTL = int(os.environ.get("REJECTED_URL_TTL", 60 * 60 * 24 * 30))
+REBUILD_CHUNK_SIZE = 5000
+
+def rebuild_seen_index():
+    """
+    Rebuilds the set of archived urls from the articles table. The new set is built under a
+    temporary key and renamed into place so lookups never see a half built index.
+    """
+    connection = establish_connection()
+    if connection is None:
+        print("Could not rebuild seen url index, keeping the current one")
+        return
+
+    conn, cur = connection
+    redis_conn = establish_redis_connection()
+    building_key = f"{SEEN_KEY}:building"
+
+    try:
+        redis_conn.delete(building_key)
+        cur.execute("SELECT url FROM articles")
+
+        count = 0
+        while True:
+            rows = cur.fetchmany(REBUILD_CHUNK_SIZE)
+            if len(rows) == 0:
+                break
+
+            # articles stored before canonicalization existed are folded onto their canonical url
+            redis_conn.sadd(building_key, *[canonicalize_url(row[0]) for row in rows])
+            count += len(rows)
+
+        # near duplicates of accepted or archived articles are not worth discovering again either
+        duplicates = accepted_duplicates()
+        if len(duplicates) > 0:
+            redis_conn.sadd(building_key, *duplicates)
+            count += len(duplicates)
+
+        if count > 0:
+            redis_conn.rename(building_key, SEEN_KEY)
+        else:
+            redis_conn.delete(SEEN_KEY)
+
+        # forget rejections that are old enough to be retried
+        redis_conn.zremrangebyscore(REJECTED_KEY, 0, time.time() - REJECTED_TTL)
+
+        print(f"Seen url index rebuilt with {count} archived urls")
+    finally:
+        cur.close()
+        conn.close()
+
+def mark_seen(url):
+    url = canonicalize_url(url)
+    try:
+        pipe = establish_redis_connection().pipeline()
+        pipe.sadd(SEEN_KEY, url)
+        pipe.zrem(REJECTED_KEY, url)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not mark {url} as seen: {e}")
+
+def is_seen(url):
+    try:
+        return bool(establish_redis_connection().sismember(SEEN_KEY, canonicalize_url(url)))
+    except Exception as e:
+        print(f"Could not read seen url index: {e}")
+        return False
+
+def mark_rejected(urls):
+    if len(urls) == 0:
+        return
+
+    now = time.time()
+    try:
+        establish_redis_connection().zadd(REJECTED_KEY, {canonicalize_url(url): now for url in urls})
+    except Exception as e:
+        print(f"Could not mark urls as rejected: {e}")
+
+def drop_known_urls(urls):
+    """
+    Returns the urls that were neither archived nor rejected recently, one spelling per page.
+    If redis is not reachable every url is kept, the index is only an optimization.
+    """
+    urls = unique_urls(urls)
+    if len(urls) == 0:
+        return urls
+
+    keys = [canonicalize_url(url) for url in urls]
+    try:
+        redis_conn = establish_redis_connection()
+        seen = redis_conn.smismember(SEEN_KEY, keys)
+        rejected_at = redis_conn.zmscore(REJECTED_KEY, keys)
+    except Exception as e:
+        print(f"Could not read seen url index: {e}")
+        return urls
+
+    cutoff = time.time() - REJECTED_TTL
+    new_urls = []
+    for url, is_seen, rejected in zip(urls, seen, rejected_at):
+        if is_seen:
+            continue
+        if rejected is not None and rejected >= cutoff:
+            continue
+        new_urls.append(url)
+
+    return new_urls
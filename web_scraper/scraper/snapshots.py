@@ -0,0 +1,84 @@
+import os
+import zlib
+import base64
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import canonicalize_url
+
+# snapshots only have to outlive one run, from the filter stage to retrieval
+SNAPSHOT_TTL = int(os.environ.get("SNAPSHOT_TTL", 60 * 60 * 24))
+# pages bigger than this (compressed) are navigated to again instead of being cached
+SNAPSHOT_MAX_BYTES = int(os.environ.get("SNAPSHOT_MAX_BYTES", 2 * 1024 * 1024))
+# ms to render a snapshot for printing, the images and stylesheets of a news page take a while
+SNAPSHOT_RENDER_TIMEOUT = int(os.environ.get("SNAPSHOT_RENDER_TIMEOUT", 30000))
+
+# serializes the rendered dom without scripts, so rendering it again does not change it,
+# and pins relative links to the page it came from. json-ld is inert and kept for extraction
+SNAPSHOT_SCRIPT = """() => {
+    const root = document.documentElement.cloneNode(true);
+    root.querySelectorAll('script:not([type="application/ld+json"]), noscript, base').forEach(el => el.remove());
+
+    let head = root.querySelector("head");
+    if (head === null) {
+        head = document.createElement("head");
+        root.prepend(head);
+    }
+    const base = document.createElement("base");
+    base.href = document.baseURI;
+    head.prepend(base);
+
+    return "<!DOCTYPE html>" + root.outerHTML;
+}"""
+
+def snapshot_key(url):
+    return f"snapshot:{canonicalize_url(url)}"
+
+def capture_snapshot(page):
+    """Returns the rendered html of the page the browser is on, or None if it could not be serialized."""
+    try:
+        return page.evaluate(SNAPSHOT_SCRIPT)
+    except Exception as e:
+        print(f"Could not snapshot {page.url}: {e}")
+        return None
+
+def store_snapshot(url, html):
+    if html is None:
+        return
+
+    blob = base64.b64encode(zlib.compress(html.encode("utf-8"))).decode("ascii")
+    if len(blob) > SNAPSHOT_MAX_BYTES:
+        return
+
+    try:
+        establish_redis_connection().set(snapshot_key(url), blob, ex=SNAPSHOT_TTL)
+    except Exception as e:
+        print(f"Could not store snapshot of {url}: {e}")
+
+def load_snapshot(url):
+    """Returns the html captured for url by the filter stage, or None if there is none."""
+    try:
+        blob = establish_redis_connection().get(snapshot_key(url))
+    except Exception as e:
+        print(f"Could not read snapshot of {url}: {e}")
+        return None
+
+    if blob is None:
+        return None
+
+    return zlib.decompress(base64.b64decode(blob)).decode("utf-8")
+
+def drop_snapshot(url):
+    try:
+        establish_redis_connection().delete(snapshot_key(url))
+    except Exception as e:
+        print(f"Could not drop snapshot of {url}: {e}")
+
+def drop_snapshots(urls):
+    """Drops the snapshots of pages that will not be retrieved, they would sit in redis until SNAPSHOT_TTL."""
+    if len(urls) == 0:
+        return
+
+    try:
+        establish_redis_connection().delete(*[snapshot_key(url) for url in urls])
+    except Exception as e:
+        print(f"Could not drop {len(urls)} snapshots: {e}")
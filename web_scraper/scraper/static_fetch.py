@@ -0,0 +1,151 @@
+import os
+from urllib.parse import urljoin, urlparse
+
+import requests
+import lxml.html
+from lxml.etree import ParserError
+from requests.adapters import HTTPAdapter
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from scraper.politeness import acquire, report_status
+
+HTTP_TIER = "http"
+BROWSER_TIER = "browser"
+
+STATIC_FETCH_TIMEOUT = float(os.environ.get("STATIC_FETCH_TIMEOUT", 10))
+STATIC_MIN_LINKS = int(os.environ.get("STATIC_MIN_LINKS", 20))
+FETCH_TIER_TTL = int(os.environ.get("FETCH_TIER_TTL", 60 * 60 * 24 * 7))
+# hosts that are known to render their links with javascript, comma separated
+JS_HOSTS = set(filter(None, os.environ.get("CRAWLER_JS_HOSTS", "").split(",")))
+
+USER_AGENT = os.environ.get(
+    "CRAWLER_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+_session = None
+
+def get_session():
+    """Returns the process wide requests session so connections are pooled between hub pages."""
+    global _session
+
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _session.headers.update({"User-Agent": USER_AGENT})
+
+    return _session
+
+def tier_key(netloc):
+    return f"crawl:fetch_tier:{netloc}"
+
+def domain_tier(netloc):
+    """Returns the tier that worked last time for this host, or None if it was never probed."""
+    if netloc in JS_HOSTS:
+        return BROWSER_TIER
+
+    try:
+        return establish_redis_connection().get(tier_key(netloc))
+    except Exception as e:
+        print(f"Could not read fetch tier for {netloc}: {e}")
+        return None
+
+def record_tier(netloc, tier):
+    try:
+        establish_redis_connection().set(tier_key(netloc), tier, ex=FETCH_TIER_TTL)
+    except Exception as e:
+        print(f"Could not record fetch tier for {netloc}: {e}")
+
+def parse_anchors(html, base_url):
+    try:
+        document = lxml.html.fromstring(html)
+    except (ParserError, ValueError):
+        return []
+
+    base_href = document.xpath("//base/@href")
+    if len(base_href) > 0:
+        base_url = urljoin(base_url, base_href[0].strip())
+
+    urls = []
+    for href in document.xpath("//a/@href"):
+        url = urljoin(base_url, href.strip())
+        if urlparse(url).scheme in ("http", "https"):
+            urls.append(url)
+
+    return urls
+
+def fetch_static_urls(url, headers=None):
+    """
+    Fetches a hub page without a browser and returns (urls, validators) where urls are the
+    links in its static html, or None when the page could not be fetched as html at all.
+    validators carries the ETag/Last-Modified of the response, or not_modified on a 304.
+    """
+    if not acquire(url):
+        return (None, {})
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=STATIC_FETCH_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Static fetch failed for {url}: {e}")
+        return (None, {})
+
+    report_status(url, response.status_code, response.headers.get("Retry-After"))
+
+    if response.status_code == 304:
+        return (None, {"not_modified": True})
+
+    if response.status_code // 100 != 2:
+        return (None, {})
+
+    if "html" not in response.headers.get("Content-Type", ""):
+        return (None, {})
+
+    validators = {
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+    }
+
+    return (parse_anchors(response.text, response.url), validators)
+
+def try_static_fetch(url, headers=None):
+    """
+    Tries the plain http tier for a hub page before any browser work.
+    Returns (urls, static_urls, tier, validators) where urls is None when the browser is needed.
+    """
+    netloc = urlparse(url).netloc
+    tier = domain_tier(netloc)
+
+    if tier == BROWSER_TIER:
+        return (None, None, tier, {})
+
+    static_urls, validators = fetch_static_urls(url, headers)
+    if static_urls is None:
+        return (None, None, tier, validators)
+
+    # once a host is known to serve its links statically, any non empty page is trusted
+    if len(static_urls) >= STATIC_MIN_LINKS or (tier == HTTP_TIER and len(static_urls) > 0):
+        if tier is None:
+            record_tier(netloc, HTTP_TIER)
+        return (static_urls, static_urls, tier, validators)
+
+    # the browser result will be cached instead, the validators of the static html do not describe it
+    return (None, static_urls, tier, {})
+
+def record_browser_fallback(url, static_urls, browser_urls, tier):
+    """
+    Records which tier should be used for a host after the browser had to be used.
+    The browser only wins when it finds clearly more links than the static html did.
+    """
+    # the static tier was skipped, nothing new was learned
+    if tier == BROWSER_TIER:
+        return
+
+    netloc = urlparse(url).netloc
+    static_count = 0 if static_urls is None else len(static_urls)
+
+    if len(browser_urls) > static_count * 1.5 and len(browser_urls) >= STATIC_MIN_LINKS:
+        record_tier(netloc, BROWSER_TIER)
+    elif static_urls is not None:
+        record_tier(netloc, HTTP_TIER)
@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import zlib
+from urllib.parse import urlparse
+
+import numpy as np
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from shared.core_lib.url_utils import registrable_domain
+from scraper.seen_index import SEEN_KEY, REJECTED_KEY
+
+MODEL_KEY = "url_classifier:model"
+
+URL_CLASSIFIER_THRESHOLD = float(os.environ.get("URL_CLASSIFIER_THRESHOLD", 0.5))
+URL_CLASSIFIER_MIN_SAMPLES = int(os.environ.get("URL_CLASSIFIER_MIN_SAMPLES", 50))
+URL_CLASSIFIER_RELOAD_SECONDS = int(os.environ.get("URL_CLASSIFIER_RELOAD_SECONDS", 600))
+
+HASH_DIMENSIONS = 2 ** 14
+TRAIN_EPOCHS = 300
+LEARNING_RATE = 0.5
+L2_PENALTY = 1e-4
+
+DATE_PATH_PATTERN = re.compile(r"/(19|20)\d\d/(0?[1-9]|1[0-2])(/|$)")
+DATE_SLUG_PATTERN = re.compile(r"(19|20)\d\d[-_]?(0[1-9]|1[0-2])[-_]?(0[1-9]|[12]\d|3[01])")
+LONG_NUMBER_PATTERN = re.compile(r"\d{5,}")
+
+DENSE_FEATURES = 12
+
+def segment_shape(segment):
+    """Maps a path segment to a coarse shape so /2024/05/some-story and /2023/11/other-story match."""
+    stem = segment.rsplit(".", 1)[0]
+
+    if stem.isdigit():
+        if len(stem) == 4 and stem[:2] in ("19", "20"):
+            return "<year>"
+        if len(stem) <= 2:
+            return "<num2>"
+        return "<num>"
+
+    if stem.count("-") >= 2 or stem.count("_") >= 2:
+        return "<slug>"
+    if LONG_NUMBER_PATTERN.search(stem):
+        return "<id>"
+
+    # short plain words (news, article, tag, author, ...) are kept literally
+    return stem.lower() if len(stem) <= 20 else "<word>"
+
+def feature_hash(token):
+    return zlib.crc32(token.encode("utf-8")) % HASH_DIMENSIONS
+
+def url_features(url):
+    """Returns (dense, hashed) features of a url: a fixed length list and a list of hash bucket indices."""
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/")
+    segments = [segment for segment in path.split("/") if segment != ""]
+    last = segments[-1] if len(segments) > 0 else ""
+    last_stem = last.rsplit(".", 1)[0]
+
+    words = [word for word in re.split(r"[-_]", last_stem) if word != ""]
+    digits = sum(c.isdigit() for c in last_stem)
+
+    dense = [
+        1.0,
+        min(len(segments), 10) / 10,
+        min(len(last_stem), 120) / 120,
+        min(len(words), 20) / 20,
+        digits / max(1, len(last_stem)),
+        1.0 if DATE_PATH_PATTERN.search(path + "/") else 0.0,
+        1.0 if DATE_SLUG_PATTERN.search(path) else 0.0,
+        1.0 if LONG_NUMBER_PATTERN.search(last_stem) else 0.0,
+        1.0 if last.endswith((".html", ".htm", ".shtml")) else 0.0,
+        1.0 if parsed.query != "" else 0.0,
+        1.0 if len(words) >= 2 else 0.0,
+        1.0 if len(segments) == 0 else 0.0,
+    ]
+
+    domain = registrable_domain(parsed.netloc)
+    shapes = [segment_shape(segment) for segment in segments]
+    template = "/".join(shapes)
+
+    tokens = [f"template:{template}", f"domain_template:{domain}:{template}"]
+    for i, shape in enumerate(shapes[:6]):
+        tokens.append(f"shape:{i}:{shape}")
+    if len(shapes) > 0:
+        tokens.append(f"first:{shapes[0]}")
+        tokens.append(f"last:{shapes[-1]}")
+        tokens.append(f"domain_first:{domain}:{shapes[0]}")
+    for i in range(len(shapes) - 1):
+        tokens.append(f"pair:{shapes[i]}/{shapes[i + 1]}")
+
+    return (dense, [feature_hash(token) for token in tokens])
+
+def build_batch(urls):
+    """
+    Vectorizes a batch of urls. Returns the dense matrix plus the flat hashed indices and
+    the row each index belongs to, which keeps the hashed part sparse.
+    """
+    dense_rows = []
+    hashed_indices = []
+    hashed_rows = []
+
+    for row, url in enumerate(urls):
+        dense, hashed = url_features(url)
+        dense_rows.append(dense)
+        hashed_indices.extend(hashed)
+        hashed_rows.extend([row] * len(hashed))
+
+    return (
+        np.array(dense_rows, dtype=np.float64).reshape(len(urls), DENSE_FEATURES),
+        np.array(hashed_indices, dtype=np.int64),
+        np.array(hashed_rows, dtype=np.int64),
+    )
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+class UrlClassifier:
+    """Logistic regression over url shape features, trained on urls we archived or rejected before."""
+
+    def __init__(self, dense_weights, hashed_weights):
+        self.dense_weights = dense_weights
+        self.hashed_weights = hashed_weights
+
+    def score(self, urls):
+        """Returns the article probability of every url in one vectorized pass."""
+        if len(urls) == 0:
+            return np.zeros(0)
+
+        dense, hashed_indices, hashed_rows = build_batch(urls)
+        logits = dense @ self.dense_weights
+        logits += np.bincount(hashed_rows, weights=self.hashed_weights[hashed_indices], minlength=len(urls))
+
+        return sigmoid(logits)
+
+    def to_json(self):
+        return json.dumps({
+            "dense": self.dense_weights.tolist(),
+            "hashed": self.hashed_weights.tolist(),
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        model = json.loads(data)
+        return cls(np.array(model["dense"]), np.array(model["hashed"]))
+
+def train(urls, labels):
+    """Full batch gradient descent with class balancing and a small L2 penalty."""
+    dense, hashed_indices, hashed_rows = build_batch(urls)
+    labels = np.array(labels, dtype=np.float64)
+
+    positives = max(1.0, labels.sum())
+    negatives = max(1.0, len(labels) - labels.sum())
+    sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+
+    dense_weights = np.zeros(DENSE_FEATURES)
+    hashed_weights = np.zeros(HASH_DIMENSIONS)
+
+    for _ in range(TRAIN_EPOCHS):
+        logits = dense @ dense_weights
+        logits += np.bincount(hashed_rows, weights=hashed_weights[hashed_indices], minlength=len(labels))
+        error = (sigmoid(logits) - labels) * sample_weights / len(labels)
+
+        dense_weights -= LEARNING_RATE * (dense.T @ error + L2_PENALTY * dense_weights)
+        hashed_gradient = np.bincount(hashed_indices, weights=error[hashed_rows], minlength=HASH_DIMENSIONS)
+        hashed_weights -= LEARNING_RATE * (hashed_gradient + L2_PENALTY * hashed_weights)
+
+    return UrlClassifier(dense_weights, hashed_weights)
+
+def train_url_classifier():
+    """
+    Retrains the classifier from the seen url index (archived articles) and the rejected
+    url index, then stores it in redis for every worker. Skipped while there is too little history.
+    """
+    redis_conn = establish_redis_connection()
+    positives = [url for url in redis_conn.smembers(SEEN_KEY) if not url.endswith(".pdf")]
+    negatives = [url for url in redis_conn.zrange(REJECTED_KEY, 0, -1) if not url.endswith(".pdf")]
+
+    if len(positives) < URL_CLASSIFIER_MIN_SAMPLES or len(negatives) < URL_CLASSIFIER_MIN_SAMPLES:
+        print(f"Not enough history to train the url classifier ({len(positives)} archived, {len(negatives)} rejected)")
+        return False
+
+    model = train(positives + negatives, [1] * len(positives) + [0] * len(negatives))
+    redis_conn.set(MODEL_KEY, model.to_json())
+
+    print(f"Url classifier trained on {len(positives)} archived and {len(negatives)} rejected urls")
+    return True
+
+_model = None
+_model_loaded_at = 0
+
+def get_url_classifier():
+    """Returns the latest trained classifier, or None if none was trained yet."""
+    global _model, _model_loaded_at
+
+    if time.monotonic() - _model_loaded_at < URL_CLASSIFIER_RELOAD_SECONDS:
+        return _model
+
+    _model_loaded_at = time.monotonic()
+    try:
+        data = establish_redis_connection().get(MODEL_KEY)
+        _model = UrlClassifier.from_json(data) if data is not None else None
+    except Exception as e:
+        print(f"Could not load url classifier: {e}")
+
+    return _model
+
+def classify_urls(urls, fallback):
+    """
+    Returns one boolean per url telling whether it looks like an article. Uses the trained
+    classifier when there is one and the fallback heuristic (called with the path) otherwise.
+    """
+    model = get_url_classifier()
+    if model is None:
+        return [fallback(urlparse(url).path) for url in urls]
+
+    return list(model.score(urls) >= URL_CLASSIFIER_THRESHOLD)
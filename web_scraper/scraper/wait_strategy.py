@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+from urllib.parse import urlparse
+
+from shared.core_lib.redis_utils import establish_redis_connection
+from scraper.politeness import acquire, async_acquire, report_status
+
+# cheapest first, this is also the order used for hosts we know nothing about
+STRATEGIES = ["domcontentloaded", "load", "networkidle"]
+
+# upper bounds (ms) of the latency histogram buckets, the last bucket is open ended
+LATENCY_BUCKETS = [250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+
+NAV_MIN_SAMPLES = int(os.environ.get("NAV_MIN_SAMPLES", 5))
+NAV_TIMEOUT_PERCENTILE = float(os.environ.get("NAV_TIMEOUT_PERCENTILE", 0.95))
+NAV_TIMEOUT_MULTIPLIER = float(os.environ.get("NAV_TIMEOUT_MULTIPLIER", 1.5))
+NAV_MIN_TIMEOUT = int(os.environ.get("NAV_MIN_TIMEOUT", 2000))
+NAV_MAX_TIMEOUT = int(os.environ.get("NAV_MAX_TIMEOUT", 30000))
+NAV_STATS_TTL = int(os.environ.get("NAV_STATS_TTL", 60 * 60 * 24 * 30))
+
+# a page has its content once the body holds enough text, a lone cookie banner does not count
+CONTENT_READY = "min => document.body !== null && document.body.innerText.length >= min"
+
+def stats_key(netloc):
+    return f"nav:stats:{netloc}"
+
+def bucket_for(elapsed_ms):
+    for bound in LATENCY_BUCKETS:
+        if elapsed_ms <= bound:
+            return bound
+
+    return "inf"
+
+def load_stats(netloc):
+    """
+    Returns the navigation stats for a host as {strategy: {"ok": n, "fail": n, "buckets": {bound: n}}}.
+    Everything is kept in one redis hash per host with fields like networkidle:ok or load:1000.
+    """
+    stats = {strategy: {"ok": 0, "fail": 0, "buckets": {}} for strategy in STRATEGIES}
+
+    try:
+        raw = establish_redis_connection().hgetall(stats_key(netloc))
+    except Exception as e:
+        print(f"Could not read navigation stats for {netloc}: {e}")
+        return stats
+
+    for field, value in raw.items():
+        strategy, _, name = field.partition(":")
+        if strategy not in stats:
+            continue
+
+        if name in ("ok", "fail"):
+            stats[strategy][name] = int(value)
+        else:
+            stats[strategy]["buckets"][name] = int(value)
+
+    return stats
+
+def percentile_timeout(buckets, default_timeout):
+    total = sum(buckets.values())
+    if total < NAV_MIN_SAMPLES:
+        return default_timeout
+
+    target = total * NAV_TIMEOUT_PERCENTILE
+    seen = 0
+    for bound in LATENCY_BUCKETS + ["inf"]:
+        seen += buckets.get(str(bound), 0)
+        if seen >= target:
+            if bound == "inf":
+                return NAV_MAX_TIMEOUT
+            return int(min(NAV_MAX_TIMEOUT, max(NAV_MIN_TIMEOUT, bound * NAV_TIMEOUT_MULTIPLIER)))
+
+    return default_timeout
+
+def plan_navigation(url, default_timeout, max_attempts):
+    """
+    Returns the list of (wait_until, timeout) attempts for a url. Strategies that worked
+    before for the host come first and timeouts follow the observed latency percentile.
+    """
+    stats = load_stats(urlparse(url).netloc)
+
+    def success_rate(strategy):
+        # laplace smoothing so an unseen strategy sits at 0.5
+        return (stats[strategy]["ok"] + 1) / (stats[strategy]["ok"] + stats[strategy]["fail"] + 2)
+
+    # sorted is stable so ties keep the cheapest strategy first
+    ranked = sorted(STRATEGIES, key=success_rate, reverse=True)
+
+    attempts = []
+    for i in range(max(1, max_attempts)):
+        strategy = ranked[i % len(ranked)]
+        attempts.append((strategy, percentile_timeout(stats[strategy]["buckets"], default_timeout)))
+
+    return attempts
+
+def record_navigation(url, strategy, elapsed_ms, ok):
+    key = stats_key(urlparse(url).netloc)
+
+    try:
+        pipe = establish_redis_connection().pipeline()
+        if ok:
+            pipe.hincrby(key, f"{strategy}:ok", 1)
+            pipe.hincrby(key, f"{strategy}:{bucket_for(elapsed_ms)}", 1)
+        else:
+            pipe.hincrby(key, f"{strategy}:fail", 1)
+        pipe.expire(key, NAV_STATS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Could not record navigation stats for {url}: {e}")
+
+def wait_for_content(page, min_text_chars, timeout_time):
+    try:
+        page.wait_for_function(CONTENT_READY, arg=min_text_chars, timeout=timeout_time)
+        return True
+    except Exception:
+        return False
+
+async def async_wait_for_content(page, min_text_chars, timeout_time):
+    try:
+        await page.wait_for_function(CONTENT_READY, arg=min_text_chars, timeout=timeout_time)
+        return True
+    except Exception:
+        return False
+
+def navigate(page, url, selector, default_timeout, max_attempts, min_text_chars=0):
+    """
+    Navigates the page to url using the wait strategy that suits the host and returns
+    True once the selector is present. domcontentloaded only waits for the selector
+    instead of the whole page, which avoids hosts that never go network idle.
+    With min_text_chars a strategy only succeeds once the page shows that much text, so
+    client rendered articles are not taken before their body exists. If the text stays
+    short through the last attempt the page is most likely just short and True is returned.
+    """
+    attempts = plan_navigation(url, default_timeout, max_attempts)
+    for i, (strategy, timeout_time) in enumerate(attempts):
+        if not acquire(url):
+            return False
+
+        start = time.monotonic()
+        try:
+            response = page.goto(url, wait_until=strategy, timeout=timeout_time)
+            if response is not None and report_status(url, response.status, response.headers.get("retry-after")):
+                return False
+
+            if strategy == "domcontentloaded":
+                page.wait_for_selector(selector, state="attached", timeout=timeout_time)
+        except Exception as e:
+            print(f"{e} RETRYING ...")
+            record_navigation(url, strategy, (time.monotonic() - start) * 1000, False)
+            continue
+
+        if min_text_chars > 0 and not wait_for_content(page, min_text_chars, timeout_time):
+            record_navigation(url, strategy, (time.monotonic() - start) * 1000, False)
+            if i == len(attempts) - 1:
+                return True
+
+            print(f"{url} has less than {min_text_chars} characters of text after {strategy} RETRYING ...")
+            continue
+
+        record_navigation(url, strategy, (time.monotonic() - start) * 1000, True)
+        return True
+
+    return False
+
+async def async_navigate(page, url, selector, default_timeout, max_attempts, min_text_chars=0):
+    """Async api version of navigate. The stats and politeness calls go to redis, so they run in threads."""
+    attempts = await asyncio.to_thread(plan_navigation, url, default_timeout, max_attempts)
+    for i, (strategy, timeout_time) in enumerate(attempts):
+        if not await async_acquire(url):
+            return False
+
+        start = time.monotonic()
+        try:
+            response = await page.goto(url, wait_until=strategy, timeout=timeout_time)
+            if response is not None and await asyncio.to_thread(
+                report_status, url, response.status, response.headers.get("retry-after")
+            ):
+                return False
+
+            if strategy == "domcontentloaded":
+                await page.wait_for_selector(selector, state="attached", timeout=timeout_time)
+        except Exception as e:
+            print(f"{e} RETRYING ...")
+            await asyncio.to_thread(record_navigation, url, strategy, (time.monotonic() - start) * 1000, False)
+            continue
+
+        if min_text_chars > 0 and not await async_wait_for_content(page, min_text_chars, timeout_time):
+            await asyncio.to_thread(record_navigation, url, strategy, (time.monotonic() - start) * 1000, False)
+            if i == len(attempts) - 1:
+                return True
+
+            print(f"{url} has less than {min_text_chars} characters of text after {strategy} RETRYING ...")
+            continue
+
+        await asyncio.to_thread(record_navigation, url, strategy, (time.monotonic() - start) * 1000, True)
+        return True
+
+    return False
@@ -1,8 +1,7 @@
-import socket
-import requests
 import os
 import json
 import shutil
+import uuid
 from urllib.parse import urlparse
 
 from celery import shared_task, chain, group
@@ -13,10 +12,15 @@ from web_scraper_project.celery import app
 from maizey_api.api_call import create_conversation, call_api
 
 from scraper.crawler import scrape_links
+from scraper.async_crawler import async_scrape_links, crawl_source, merge_crawl_results
 from scraper.basic_filter import filter_scraped_urls
 from scraper.pdf_scraper import scrape_pdf_text
 from scraper.retrieval import retrieve_page, retrieve_pdf
 from scraper.maizey_filter import maizey_filter_content
+from scraper.seen_index import rebuild_seen_index, drop_known_urls
+from scraper.url_classifier import train_url_classifier
+from scraper.browser_pool import pick_browser, assign_browsers
+from scraper.batch_planner import worker_concurrency, browser_slots, plan_batches
 
 from shared.core_lib.db_utils import establish_connection
 
@@ -32,18 +36,6 @@ def batch_items(arr, batch_count):
 
     return batches
 
-def retrieve_browser_link(browser):
-    try:
-        browser_ip = socket.gethostbyname(browser)
-        response = requests.get(f"http://{browser_ip}:9222/json/version")
-        return response.json()["webSocketDebuggerUrl"]
-    except socket.gaierror as e:
-        print(f"DNS resolution failed: {e}")
-        return None
-    except Exception as e:
-        print(e)
-        return None
-
 def wipe_folder(path):
     for filename in os.listdir(path):
         file_path = os.path.join(path, filename)
@@ -65,52 +57,96 @@ def start_scraping_workflow(sources_data):
 
     wipe_folder("/app/pages")
 
-    browser_connection = retrieve_browser_link("browser")
+    try:
+        rebuild_seen_index()
+    except Exception as e:
+        print(f"Failed to rebuild seen url index: {e}")
+
+    try:
+        train_url_classifier()
+    except Exception as e:
+        print(f"Failed to train url classifier: {e}")
+
+    browser_connection = pick_browser()
     if browser_connection is None:
         print("ERROR. Could not connect to browser instance!")
         return
 
-    workflow = chain(
-        scrape_links.s(browser_connection, sources_data),
-        process_url_list.s(browser_connection)
-    )
+    # identifies the run in crawl state and per run stats
+    run_id = uuid.uuid4().hex
+
+    # CRAWLER_MODE=sync falls back to the single page crawler,
+    # CRAWLER_MODE=async crawls every source inside one task
+    crawler_mode = os.environ.get("CRAWLER_MODE", "distributed")
+    if crawler_mode == "sync":
+        workflow = chain(
+            scrape_links.s(browser_connection, sources_data),
+            process_url_list.s(browser_connection, run_id)
+        )
+    elif crawler_mode == "async":
+        workflow = chain(
+            async_scrape_links.s(browser_connection, sources_data),
+            process_url_list.s(browser_connection, run_id)
+        )
+    else:
+        # one crawl task per source, merged into a single url list once they all finish
+        browsers = assign_browsers(len(sources_data))
+        workflow = chain(
+            group(
+                crawl_source.s(browser or browser_connection, source, run_id)
+                for browser, source in zip(browsers, sources_data)
+            ),
+            merge_crawl_results.s(run_id),
+            process_url_list.s(browser_connection, run_id)
+        )
     workflow.delay()
     print("Scraping workflow initiated.")
 
 @shared_task
-def process_url_list(discovered_paths, browser_connection):
+def process_url_list(discovered_paths, browser_connection, run_id=None):
     """
     Receives a list of URLs and creates a group of parallel processing chains.
-    Each chain validates one URL and then generates a PDF for it.
+    Each chain validates a batch of URLs and then generates a PDF for each one that is kept.
+    Batch sizes come from scraper.batch_planner.
     """
     urls, pdfs, excluded = discovered_paths
 
     print(f"Number of urls: {len(urls)}")
     print(f"Number excluded: {len(excluded)}")
 
+    # skip everything that was archived or rejected by an earlier run
+    new_urls = drop_known_urls(urls)
+    new_pdfs = drop_known_urls(pdfs)
+    print(f"Skipping {len(urls) - len(new_urls)} known urls and {len(pdfs) - len(new_pdfs)} known pdfs")
+    urls, pdfs = new_urls, new_pdfs
+
     categories_config = []
     with open("./categories_config.json", "r") as f:
         categories_config = json.load(f)
 
+    concurrency = worker_concurrency(app)
+
     # dispatch url scraping pipeline
-    batched_urls = batch_items(urls, 1)
+    batched_urls = batch_items(urls, plan_batches("page", len(urls), concurrency, browser_slots()))
+    browsers = assign_browsers(len(batched_urls))
     url_group = group(
         chain(
-            filter_scraped_urls.s((batch, browser_connection)),
-            maizey_filter_content.s(categories_config),
-            retrieve_page.s(browser_connection)
-        ) for batch in batched_urls
+            filter_scraped_urls.s((batch, browser or browser_connection)),
+            maizey_filter_content.s(categories_config, run_id),
+            retrieve_page.s(browser or browser_connection)
+        ) for browser, batch in zip(browsers, batched_urls)
     )
 
     url_group.delay()
 
     # dispatch pdf scraping pipeline
+    batched_pdfs = batch_items(pdfs, plan_batches("pdf", len(pdfs), concurrency))
     pdf_group = group(
         chain(
-            scrape_pdf_text.s(pdf),
-            maizey_filter_content.s(categories_config),
+            scrape_pdf_text.s(batch),
+            maizey_filter_content.s(categories_config, run_id),
             retrieve_pdf.s()
-        ) for pdf in pdfs
+        ) for batch in batched_pdfs
     )
 
     pdf_group.delay()